@@ -145,7 +145,8 @@ def gps_track_deduplication():
         (37.7949, -122.3994),  # Exact duplicate
     ]
 
-    # Deduplicate: only add if no point within threshold
+    # Deduplicate: only add if no point within threshold (inclusive). `exists_within`
+    # stops at the first point in range, so it reports no distance.
     threshold_km = 0.1  # 100 meters
     threshold_degrees = threshold_km / 111.0
 
@@ -153,24 +154,13 @@ def gps_track_deduplication():
 
     for i, (lat, lon) in enumerate(raw_track):
         point = (lat, lon)
-        if unique_points.empty():
+        if unique_points.exists_within(point, kdtree.L2(), threshold_degrees):
+            print(f"Point {i}: ({lat:.4f}, {lon:.4f}) - Reused (within {threshold_km * 1000:.0f}m)")
+        else:
             point_id = len(deduplicated_track)
             unique_points.insert(point, {"id": point_id, "lat": lat, "lon": lon})
             deduplicated_track.append(point)
-            print(f"Point {i}: ({lat:.4f}, {lon:.4f}) - Added (first point)")
-        else:
-            closest = unique_points.find_closest(point)
-            dist_deg = kdtree.L2().dist(closest.p, point)
-            dist_km = dist_deg * 111.0
-
-            if dist_deg < threshold_degrees:
-                reused_point = (closest.p.x, closest.p.y)
-                print(f"Point {i}: ({lat:.4f}, {lon:.4f}) - Reused {reused_point} ({dist_km:.1f}m away)")
-            else:
-                point_id = len(deduplicated_track)
-                unique_points.insert(point, {"id": point_id, "lat": lat, "lon": lon})
-                deduplicated_track.append(point)
-                print(f"Point {i}: ({lat:.4f}, {lon:.4f}) - Added ({dist_km:.1f}km from nearest)")
+            print(f"Point {i}: ({lat:.4f}, {lon:.4f}) - Added")
 
     print(f"\nTrack simplified: {len(raw_track)} points → {len(deduplicated_track)} unique points")
     print(f"Reduction: {(1 - len(deduplicated_track)/len(raw_track))*100:.0f}%\n")
@@ -15,6 +15,7 @@
 #pragma once
 
 #include <algorithm>
+#include <array>
 #include <bit>
 #include <cassert>
 #include <cmath>
@@ -65,6 +66,14 @@ concept IsMetric = requires(M m, P1 p1, P2 p2) {
   { m.axis_dist(p1, p2, 0) };
 };
 
+// Metrics that are a norm over the per-axis offsets can combine the `axis_dist` of
+// both axes into a lower bound for a whole region, which prunes more than either
+// axis alone. Metrics without `combine` fall back to the single-axis bound.
+template <typename M, typename D>
+concept HasAxisCombine = requires(M m, D a, D b) {
+  { m.combine(a, b) };
+};
+
 using Pointi = Point<int>;
 using Pointf = Point<float>;
 using Pointd = Point<double>;
@@ -92,6 +101,7 @@ struct L1 {
   auto axis_dist(const IsPoint auto& a, const IsPoint auto& b, int axis) const {
     return std::abs(a.coords[axis] - b.coords[axis]);
   }
+  auto combine(auto a, auto b) const { return a + b; }
 };
 
 struct L2 {
@@ -101,6 +111,7 @@ struct L2 {
   double axis_dist(const IsPoint auto& a, const IsPoint auto& b, int axis) const {
     return std::abs(static_cast<double>(a.coords[axis]) - b.coords[axis]);
   }
+  double combine(double a, double b) const { return std::hypot(a, b); }
 };
 
 struct L2sq {
@@ -113,6 +124,7 @@ struct L2sq {
     auto d = a.coords[axis] - b.coords[axis];
     return d * d;
   }
+  auto combine(auto a, auto b) const { return a + b; }
 };
 
 struct Linf {
@@ -122,6 +134,7 @@ struct Linf {
   auto axis_dist(const IsPoint auto& a, const IsPoint auto& b, int axis) const {
     return std::abs(a.coords[axis] - b.coords[axis]);
   }
+  auto combine(auto a, auto b) const { return std::max(a, b); }
 };
 
 template <typename BaseMetric, typename T>
@@ -147,6 +160,9 @@ struct Toroidal {
     p2.coords[axis] = dist;
     return base.axis_dist(p1, p2, axis);
   }
+
+  // No `combine`: under wraparound `axis_dist` isn't a true lower bound for the far
+  // side of a split, and combining both axes would prune even more wrongly.
 };
 
 struct GreatCircle {
@@ -180,12 +196,19 @@ class KDTree {
   using Entry = kdtree::Entry<PointType, ValueType>;
 
  private:
+  // Nodes live in a single vector and refer to their children by index, so that a
+  // rebuilt tree can be laid out for cache-friendly descents (see `relayout`).
+  using NodeIndex = uint32_t;
+  static constexpr NodeIndex kNone = std::numeric_limits<NodeIndex>::max();
+  static constexpr NodeIndex kFree = kNone - 1;  // In `children[0]` of free slots.
+
+  // A node's depth, and so its split axis, is tracked while descending rather than
+  // stored, which keeps nodes free of padding: 32 bytes for `KDTreed`, 24 for `KDTreei`.
   struct Node {
     Entry entry;
-    int depth;
-    std::unique_ptr<Node> children[2];
+    NodeIndex children[2];
 
-    Node(Entry e, int d) : entry(e), depth(d) {}
+    Node(Entry e) : entry(e), children{kNone, kNone} {}
   };
 
  public:
@@ -197,27 +220,25 @@ class KDTree {
     using reference = Entry&;
     using difference_type = std::ptrdiff_t;
 
+    // Every slot in `nodes` is either in the tree or free, so iterating is a scan of
+    // the vector that skips free slots, with no stack to allocate.
     Iterator() {}
-    Iterator(const Node* n) { if (n) stack.push_back(n); }
+    Iterator(const std::vector<Node>* n, size_t i) : nodes(n), index(i) {
+      skip_free();
+    }
 
     const Entry& operator*() const {
-      assert(!stack.empty());
-      return stack.back()->entry;
+      assert(index < nodes->size());
+      return (*nodes)[index].entry;
     }
     const Entry* operator->() const {
-      assert(!stack.empty());
-      return &stack.back()->entry;
+      assert(index < nodes->size());
+      return &(*nodes)[index].entry;
     }
     Iterator& operator++() {
-      assert(!stack.empty());
-      const Node* node = stack.back();
-      stack.pop_back();
-      if (node->children[1]) {
-        stack.push_back(node->children[1].get());
-      }
-      if (node->children[0]) {
-        stack.push_back(node->children[0].get());
-      }
+      assert(index < nodes->size());
+      ++index;
+      skip_free();
       return *this;
     }
     Iterator operator++(int) {
@@ -225,75 +246,134 @@ class KDTree {
       ++*this;
       return tmp;
     }
-    bool operator==(const Iterator&) const = default;
-    bool operator!=(const Iterator&) const = default;
+    bool operator==(const Iterator& o) const { return index == o.index; }
+    bool operator!=(const Iterator& o) const { return index != o.index; }
    private:
-    std::vector<const Node*> stack;
+    const std::vector<Node>* nodes = nullptr;
+    size_t index = 0;
+
+    void skip_free() {
+      while (index < nodes->size() && (*nodes)[index].children[0] == kFree) {
+        ++index;
+      }
+    }
   };
   using const_iterator = Iterator;
 
-  KDTree() : root(nullptr), count(0), sum_depth(0) {}
+  KDTree() : root(kNone), count(0), sum_depth(0) {}
   KDTree(const std::vector<Entry>& entries) : KDTree() {
-    std::vector<std::unique_ptr<Node>> nodes;
-    nodes.reserve(entries.size());
-    for (const auto& e : entries) {
-      nodes.push_back(std::make_unique<Node>(e, 0));
-    }
-    root = build_balanced_tree(nodes.begin(), nodes.end(), 0);
-    assert(entries.size() == size());
+    insert_many(entries);
   }
 
-  bool empty() const { return root == nullptr; }
+  bool empty() const { return root == kNone; }
   size_t size() const { return static_cast<size_t>(count); }
   void clear() {
-    root.reset();
+    // Release the storage, keeping only what `reserve` asked for.
+    nodes = std::vector<Node>();
+    nodes.reserve(reserved);
+    free_nodes = std::vector<NodeIndex>();
+    root = kNone;
     count = 0;
     sum_depth = 0;
   }
+  // Reserves room for `n` nodes, so inserting up to that many doesn't reallocate. The
+  // reservation is kept across rebalances.
+  void reserve(size_t n) {
+    reserved = n;
+    nodes.reserve(n);
+  }
+  size_t capacity() const { return nodes.capacity(); }
 
-  Iterator begin() const { return Iterator(root.get()); }
-  Iterator end() const { return Iterator(); }
+  Iterator begin() const { return Iterator(&nodes, 0); }
+  Iterator end() const { return Iterator(&nodes, nodes.size()); }
 
   bool insert(PointType p, ValueType v) { return insert({p, v}); }
   bool insert(Entry e) { return insert_or_set(e, false); }
   bool set(PointType p, ValueType v) { return set({p, v}); }
   bool set(Entry e) { return insert_or_set(e, true); }
 
+  // Insert a batch of entries, returning how many were inserted. Like `insert`, points
+  // that already exist keep their value, as does the first of any duplicates within
+  // `entries`. Large batches are merged with the existing nodes and rebuilt into a
+  // balanced tree in one pass instead of descending and rebalancing per entry.
+  size_t insert_many(const std::vector<Entry>& entries) {
+    if (entries.size() * std::bit_width(static_cast<size_t>(count)) < static_cast<size_t>(count)) {
+      // Small relative to the tree: k descents are cheaper than an n log n rebuild.
+      size_t inserted = 0;
+      for (const auto& e : entries) {
+        inserted += insert(e);
+      }
+      return inserted;
+    }
+
+    size_t before = size();
+    std::vector<NodeIndex> indices;
+    indices.reserve(before + entries.size());
+    collect_nodes(root, 0, indices);
+    root = kNone;
+    nodes.reserve(nodes.size() + entries.size());
+    for (const auto& e : entries) {
+      indices.push_back(new_node(e));
+    }
+
+    // Existing nodes were collected first, so a stable sort keeps them ahead of any new
+    // entry with the same point and `unique` keeps the existing value. The dropped
+    // duplicates are left unreachable and discarded by `relayout`. Sort the points
+    // alongside their indices rather than through them to keep the sort cache friendly.
+    std::vector<std::pair<PointType, NodeIndex>> keys;
+    keys.reserve(indices.size());
+    for (NodeIndex index : indices) {
+      keys.emplace_back(nodes[index].entry.p, index);
+    }
+    std::stable_sort(keys.begin(), keys.end(), [](const auto& a, const auto& b) {
+      return a.first < b.first;
+    });
+    keys.erase(std::unique(keys.begin(), keys.end(), [](const auto& a, const auto& b) {
+      return a.first == b.first;
+    }), keys.end());
+    indices.clear();
+    for (const auto& key : keys) {
+      indices.push_back(key.second);
+    }
+
+    root = build_balanced_tree(indices.begin(), indices.end(), 0);
+    assert(indices.size() == size());
+    relayout();
+    return size() - before;
+  }
+
   bool remove(PointType p) {
-    std::unique_ptr<Node>* node = &root;
-    while (*node) {
-      if ((*node)->entry.p == p) {
-        remove_node(*node);
+    NodeIndex* node = &root;
+    int depth = 0;
+    while (*node != kNone) {
+      if (nodes[*node].entry.p == p) {
+        remove_node(*node, depth);
         return true;
       }
-      int axis = (*node)->depth % 2;
-      int child = (p.coords[axis] < (*node)->entry.p.coords[axis] ? 0 : 1);
-      node = &(*node)->children[child];
+      int axis = depth % 2;
+      int child = (p.coords[axis] < nodes[*node].entry.p.coords[axis] ? 0 : 1);
+      node = &nodes[*node].children[child];
+      depth += 1;
     }
     return false;
   }
 
   bool exists(PointType p) const {
-    return bool(find(p));
+    return find_node(p) != kNone;
   }
 
   std::optional<Entry> find(PointType p) const {
-    Node* node = root.get();
-    while (node) {
-      if (node->entry.p == p) {
-        return node->entry;
-      }
-      int axis = node->depth % 2;
-      int child = (p.coords[axis] < node->entry.p.coords[axis] ? 0 : 1);
-      node = node->children[child].get();
+    NodeIndex node = find_node(p);
+    if (node == kNone) {
+      return {};
     }
-    return {};
+    return nodes[node].entry;
   }
 
   template <typename Metric = L2sq>
     requires IsMetric<Metric, PointType, PointType>
   Entry find_closest(const IsPoint auto& p, const Metric& metric = Metric{}) const {
-    assert(root != nullptr);
+    assert(root != kNone);
     return *find_closest(p, metric, -1);
   }
 
@@ -301,59 +381,88 @@ class KDTree {
   std::optional<Entry> find_closest(const IsPoint auto& p, const Metric& metric, double max_dist) const
     requires IsMetric<Metric, decltype(p), PointType>
   {
-    if (!root) {
-      return std::nullopt;
-    }
+    if constexpr (std::same_as<Metric, L2>) {
+      return find_closest(p, L2sqAsDouble{}, squared(max_dist));
+    } else {
+      if (root == kNone) {
+        return std::nullopt;
+      }
 
-    using DistanceType = decltype(metric.dist(p, root->entry.p));
-    const Node* best_node = nullptr;
-    DistanceType best_dist = (max_dist < 0 ? std::numeric_limits<DistanceType>::max()
-                                           : static_cast<DistanceType>(max_dist));
+      using DistanceType = decltype(metric.dist(p, nodes[root].entry.p));
+      NodeIndex best_node = kNone;
+      DistanceType best_dist = (max_dist < 0 ? std::numeric_limits<DistanceType>::max()
+                                             : static_cast<DistanceType>(max_dist));
 
-    find_closest_impl<Metric>(root.get(), p, best_dist, best_node, metric);
+      find_closest_impl<Metric>(root, 0, p, {0, 0}, best_dist, best_node, metric);
 
-    if (best_node) {
-      return best_node->entry;
+      if (best_node != kNone) {
+        return nodes[best_node].entry;
+      }
+      return std::nullopt;
     }
-    return std::nullopt;
   }
 
   template <typename Metric = L2sq>
   std::vector<Entry> find_closest_k(const IsPoint auto& p, size_t k, const Metric& metric = Metric{}, double max_dist = -1.0) const
     requires IsMetric<Metric, decltype(p), PointType>
   {
-    if (!root || k == 0) {
-      return {};
-    }
+    if constexpr (std::same_as<Metric, L2>) {
+      return find_closest_k(p, k, L2sqAsDouble{}, squared(max_dist));
+    } else {
+      if (root == kNone || k == 0) {
+        return {};
+      }
 
-    using DistanceType = decltype(metric.dist(p, root->entry.p));
-    std::priority_queue<std::pair<DistanceType, const Node*>> pq;
-    DistanceType best_dist = (max_dist < 0 ? std::numeric_limits<DistanceType>::max()
-                                           : static_cast<DistanceType>(max_dist));
+      using DistanceType = decltype(metric.dist(p, nodes[root].entry.p));
+      std::priority_queue<std::pair<DistanceType, NodeIndex>> pq;
+      DistanceType best_dist = (max_dist < 0 ? std::numeric_limits<DistanceType>::max()
+                                             : static_cast<DistanceType>(max_dist));
 
-    find_closest_k_impl<Metric>(root.get(), p, k, best_dist, pq, metric);
+      find_closest_k_impl<Metric>(root, 0, p, k, best_dist, pq, metric);
 
-    std::vector<Entry> results;
-    results.reserve(pq.size());
-    while (!pq.empty()) {
-      results.push_back(pq.top().second->entry);
-      pq.pop();
+      std::vector<Entry> results;
+      results.reserve(pq.size());
+      while (!pq.empty()) {
+        results.push_back(nodes[pq.top().second].entry);
+        pq.pop();
+      }
+      std::reverse(results.begin(), results.end());
+      return results;
     }
-    std::reverse(results.begin(), results.end());
-    return results;
   }
 
   template <typename Metric>
   std::vector<Entry> find_all_within(const IsPoint auto& p, const Metric& metric, double radius) const
     requires IsMetric<Metric, decltype(p), PointType>
   {
-    if (!root) {
-      return {};
+    if constexpr (std::same_as<Metric, L2>) {
+      return find_all_within(p, L2sqAsDouble{}, squared(radius));
+    } else {
+      if (root == kNone) {
+        return {};
+      }
+      std::vector<Entry> results;
+      using DistanceType = decltype(metric.dist(p, nodes[root].entry.p));
+      find_all_within_impl<Metric>(root, 0, p, static_cast<DistanceType>(radius), results, metric);
+      return results;
+    }
+  }
+
+  // Whether any entry is within `radius` of `p`. Stops at the first one found, so it is
+  // cheaper than `find_closest` with a `max_dist` when the closest entry isn't needed.
+  template <typename Metric>
+  bool exists_within(const IsPoint auto& p, const Metric& metric, double radius) const
+    requires IsMetric<Metric, decltype(p), PointType>
+  {
+    if constexpr (std::same_as<Metric, L2>) {
+      return exists_within(p, L2sqAsDouble{}, squared(radius));
+    } else {
+      if (root == kNone || radius < 0) {
+        return false;
+      }
+      using DistanceType = decltype(metric.dist(p, nodes[root].entry.p));
+      return exists_within_impl<Metric>(root, 0, p, {0, 0}, static_cast<DistanceType>(radius), metric);
     }
-    std::vector<Entry> results;
-    using DistanceType = decltype(metric.dist(p, root->entry.p));
-    find_all_within_impl<Metric>(root.get(), p, static_cast<DistanceType>(radius), results, metric);
-    return results;
   }
 
 
@@ -361,7 +470,7 @@ class KDTree {
   Entry pop_closest(const IsPoint auto& p, const Metric& metric = Metric{})
     requires IsMetric<Metric, decltype(p), PointType>
   {
-    assert(root != nullptr);
+    assert(root != kNone);
     return *pop_closest(p, metric, -1);
   }
 
@@ -369,31 +478,38 @@ class KDTree {
   std::optional<Entry> pop_closest(const IsPoint auto& p, const Metric& metric, double max_dist)
     requires IsMetric<Metric, decltype(p), PointType>
   {
-    if (!root) {
-      return std::nullopt;
-    }
+    if constexpr (std::same_as<Metric, L2>) {
+      return pop_closest(p, L2sqAsDouble{}, squared(max_dist));
+    } else {
+      if (root == kNone) {
+        return std::nullopt;
+      }
 
-    const Node* best_node = nullptr;
+      NodeIndex* best_node = nullptr;
+      int best_depth = 0;
 
-    using DistanceType = decltype(metric.dist(p, root->entry.p));
-    DistanceType best_dist = (max_dist < 0 ? std::numeric_limits<DistanceType>::max()
-                                           : static_cast<DistanceType>(max_dist));
+      using DistanceType = decltype(metric.dist(p, nodes[root].entry.p));
+      DistanceType best_dist = (max_dist < 0 ? std::numeric_limits<DistanceType>::max()
+                                             : static_cast<DistanceType>(max_dist));
 
-    find_closest_impl<Metric>(root.get(), p, best_dist, best_node, metric);
+      // Keep the link to the best node so it can be removed in place, rather than
+      // descending again by point.
+      find_closest_impl_mutable<Metric>(&root, 0, p, {0, 0}, best_dist, best_node, best_depth, metric);
 
-    if (best_node) {
-      Entry out = best_node->entry;
-      remove(best_node->entry.p);
-      return out;
+      if (best_node) {
+        Entry out = nodes[*best_node].entry;
+        remove_node(*best_node, best_depth);
+        return out;
+      }
+      return std::nullopt;
     }
-    return std::nullopt;
   }
 
   void print_tree(std::ostream& stream = std::cout) const {
-    if (root) {
-      stream << root->entry << std::endl;
-      print_tree(stream, root->children[0].get(), "", true);
-      print_tree(stream, root->children[1].get(), "", false);
+    if (root != kNone) {
+      stream << nodes[root].entry << std::endl;
+      print_tree(stream, nodes[root].children[0], "", true);
+      print_tree(stream, nodes[root].children[1], "", false);
     }
   }
 
@@ -405,20 +521,21 @@ class KDTree {
   void validate() const;  // Implemented in test file
 
   void rebalance() {
-    if (!root) {
+    if (root == kNone) {
       return;
     }
 
-    std::vector<std::unique_ptr<Node>> nodes;
-    nodes.reserve(count);
-    collect_nodes(std::move(root), nodes);
+    std::vector<NodeIndex> indices;
+    indices.reserve(count);
+    collect_nodes(root, 0, indices);
+    root = kNone;
 
-    assert(!root);
     assert(sum_depth == 0);
     assert(count == 0);
 
-    root = build_balanced_tree(nodes.begin(), nodes.end(), 0);
-    assert(nodes.size() == size());
+    root = build_balanced_tree(indices.begin(), indices.end(), 0);
+    assert(indices.size() == size());
+    relayout();
   }
 
   std::string balance_str() const {
@@ -427,7 +544,7 @@ class KDTree {
   }
 
   size_t depth_max() const {
-    return static_cast<size_t>(depth_max(root.get()));
+    return static_cast<size_t>(depth_max(root, 0));
   }
 
   double depth_avg() const {
@@ -440,7 +557,7 @@ class KDTree {
 
   double depth_stddev() const {
     if (count > 0) {
-      auto [_, variance] = depth_variance(root.get());
+      auto [_, variance] = depth_variance(root);
       return std::sqrt(variance / count);
     } else {
       return 0;
@@ -451,32 +568,105 @@ class KDTree {
     if (count == 0) {
       return 1;
     } else {
-      int leaves = leaf_count(root.get());
+      int leaves = leaf_count(root);
       return 2.0 * leaves / count;
     }
   }
 
  private:
-  std::unique_ptr<Node> root;
+  // L2 ranks points the same as L2 squared, so searches with L2 compare squared
+  // distances instead, saving a hypot per visited node. Computed in double like L2 so
+  // integer coordinates can't overflow.
+  struct L2sqAsDouble {
+    double dist(const IsPoint auto& a, const IsPoint auto& b) const {
+      double dx = static_cast<double>(a.x) - b.x;
+      double dy = static_cast<double>(a.y) - b.y;
+      return dx * dx + dy * dy;
+    }
+    double axis_dist(const IsPoint auto& a, const IsPoint auto& b, int axis) const {
+      double d = static_cast<double>(a.coords[axis]) - b.coords[axis];
+      return d * d;
+    }
+    double combine(double a, double b) const { return a + b; }
+  };
+
+  // Squares a distance limit, keeping negative values as "no limit".
+  static double squared(double limit) { return limit < 0 ? limit : limit * limit; }
+
+  std::vector<Node> nodes;
+  std::vector<NodeIndex> free_nodes;  // Slots of removed nodes, reused by `new_node`.
+  size_t reserved = 0;  // Capacity requested by `reserve`, kept by `relayout`.
+  NodeIndex root;
   int count;
   int64_t sum_depth;
 
+  NodeIndex new_node(Entry e) {
+    if (!free_nodes.empty()) {
+      NodeIndex index = free_nodes.back();
+      free_nodes.pop_back();
+      nodes[index] = Node(e);
+      return index;
+    }
+    nodes.emplace_back(e);
+    return static_cast<NodeIndex>(nodes.size() - 1);
+  }
+
+  // Exact lookup: a single descent, as equal points always sort right.
+  NodeIndex find_node(PointType p) const {
+    NodeIndex node = root;
+    int depth = 0;
+    while (node != kNone) {
+      const Node& n = nodes[node];
+      if (n.entry.p == p) {
+        return node;
+      }
+      int axis = depth % 2;
+      node = n.children[p.coords[axis] < n.entry.p.coords[axis] ? 0 : 1];
+      depth += 1;
+    }
+    return kNone;
+  }
+
+  // Hints that `nodes[index]` will be read soon.
+  void prefetch(NodeIndex index) const {
+#if defined(__GNUC__) || defined(__clang__)
+    if (index != kNone) {
+      __builtin_prefetch(&nodes[index]);
+    }
+#else
+    (void)index;
+#endif
+  }
+
+  void free_node(NodeIndex index) {
+    nodes[index].entry = Entry();  // Release the value, which may own a resource.
+    nodes[index].children[0] = kFree;
+    free_nodes.push_back(index);
+  }
+
   bool insert_or_set(Entry e, bool replace) {
-    std::unique_ptr<Node>* node = &root;
+    // Track the parent rather than a pointer to the child link, as allocating the new
+    // node may reallocate `nodes`.
+    NodeIndex parent = kNone;
+    int child = 0;
+    NodeIndex node = root;
     int depth = 0;
-    while (*node) {
-      if ((*node)->entry.p == e.p) {
+    while (node != kNone) {
+      Node& n = nodes[node];
+      if (n.entry.p == e.p) {
         if (replace) {
-          (*node)->entry.value = e.value;
+          n.entry.value = e.value;
         }
         return false; // Point already exists
       }
       int axis = depth % 2;
-      int child = (e.p.coords[axis] < (*node)->entry.p.coords[axis] ? 0 : 1);
-      node = &(*node)->children[child];
+      child = (e.p.coords[axis] < n.entry.p.coords[axis] ? 0 : 1);
+      parent = node;
+      node = n.children[child];
       depth += 1;
     }
-    *node = std::make_unique<Node>(e, depth);
+    NodeIndex index = new_node(e);
+    (parent == kNone ? root : nodes[parent].children[child]) = index;
     count += 1;
     sum_depth += depth;
 
@@ -493,71 +683,117 @@ class KDTree {
     return true;
   }
 
-  // Const version for find_closest
+  // Const version for find_closest. `node` must not be kNone: children are checked
+  // before recursing so that leaves, roughly half of all nodes, cost a single
+  // distance evaluation rather than two extra calls that immediately return.
+  // `offset` holds the per-axis distance from `p` to the region covered by `node`.
   template <typename Metric, typename DistanceType>
   void find_closest_impl(
-      const Node* node, const IsPoint auto& p,
+      NodeIndex node, int depth, const IsPoint auto& p,
+      std::array<DistanceType, 2> offset,
       DistanceType& best_dist,
-      const Node*& best_node,
+      NodeIndex& best_node,
       const Metric& metric) const {
-    if (!node) {
-      return;
-    }
-
-    auto dist = metric.dist(node->entry.p, p);
+    const Node& n = nodes[node];
+    auto dist = metric.dist(n.entry.p, p);
     if (dist <= best_dist) {
       best_dist = dist;
       best_node = node;
     }
 
-    int axis = node->depth % 2;
-    int search_first = (p.coords[axis] < node->entry.p.coords[axis]) ? 0 : 1;
-    find_closest_impl<Metric>(node->children[search_first].get(), p, best_dist, best_node, metric);
+    NodeIndex left = n.children[0];
+    NodeIndex right = n.children[1];
+    if (left == kNone && right == kNone) {
+      return;
+    }
 
-    auto ad = metric.axis_dist(p, node->entry.p, axis);
-    if (ad <= best_dist) {
-      find_closest_impl<Metric>(node->children[!search_first].get(), p, best_dist, best_node, metric);
+    int axis = depth % 2;
+    int search_first = (p.coords[axis] < n.entry.p.coords[axis]) ? 0 : 1;
+    NodeIndex near = (search_first ? right : left);
+    NodeIndex far = (search_first ? left : right);
+    if (near != kNone) {
+      find_closest_impl<Metric>(near, depth + 1, p, offset, best_dist, best_node, metric);
+    }
+
+    if (far != kNone) {
+      offset[axis] = metric.axis_dist(p, n.entry.p, axis);
+      // Once there is a match, a region no closer than it can only hold ties, so skip
+      // it. Before that `best_dist` is the inclusive `max_dist`.
+      auto bound = region_dist(offset, axis, metric);
+      if (bound < best_dist || (bound == best_dist && best_node == kNone)) {
+        find_closest_impl<Metric>(far, depth + 1, p, offset, best_dist, best_node, metric);
+      }
     }
   }
 
-  // Mutable version for pop_closest
+  // Lower bound on the distance from the query to a region given its per-axis
+  // offsets, where `axis` is the one that was just updated.
+  template <typename Metric, typename DistanceType>
+  static DistanceType region_dist(
+      const std::array<DistanceType, 2>& offset, int axis, const Metric& metric) {
+    if constexpr (HasAxisCombine<Metric, DistanceType>) {
+      return static_cast<DistanceType>(metric.combine(offset[0], offset[1]));
+    } else {
+      return offset[axis];
+    }
+  }
+
+  // Mutable version for pop_closest. Searches like `find_closest_impl`, but `node` is
+  // the link (root or a child slot) to the node to visit and `best_node` points at the
+  // link to the best node, so that it can be removed without descending again.
   template <typename Metric, typename DistanceType>
   void find_closest_impl_mutable(
-      std::unique_ptr<Node>* node, const IsPoint auto& p,
+      NodeIndex* node, int depth, const IsPoint auto& p,
+      std::array<DistanceType, 2> offset,
       DistanceType& best_dist,
-      std::unique_ptr<Node>*& best_node,
+      NodeIndex*& best_node,
+      int& best_depth,
       const Metric& metric) {
-    if (!*node) {
-      return;
-    }
-
-    auto dist = metric.dist((*node)->entry.p, p);
+    Node& n = nodes[*node];
+    auto dist = metric.dist(n.entry.p, p);
     if (dist <= best_dist) {
       best_dist = dist;
       best_node = node;
+      best_depth = depth;
     }
 
-    int axis = (*node)->depth % 2;
-    int search_first = (p.coords[axis] < (*node)->entry.p.coords[axis]) ? 0 : 1;
-    find_closest_impl_mutable<Metric>(&(*node)->children[search_first], p, best_dist, best_node, metric);
+    if (n.children[0] == kNone && n.children[1] == kNone) {
+      return;
+    }
 
-    auto ad = metric.axis_dist(p, (*node)->entry.p, axis);
-    if (ad <= best_dist) {
-      find_closest_impl_mutable<Metric>(&(*node)->children[!search_first], p, best_dist, best_node, metric);
+    int axis = depth % 2;
+    int search_first = (p.coords[axis] < n.entry.p.coords[axis]) ? 0 : 1;
+    NodeIndex* near = &n.children[search_first];
+    NodeIndex* far = &n.children[!search_first];
+    if (*near != kNone) {
+      find_closest_impl_mutable<Metric>(near, depth + 1, p, offset, best_dist, best_node, best_depth, metric);
+    }
+
+    if (*far != kNone) {
+      offset[axis] = metric.axis_dist(p, n.entry.p, axis);
+      auto bound = region_dist(offset, axis, metric);
+      if (bound < best_dist || (bound == best_dist && best_node == nullptr)) {
+        find_closest_impl_mutable<Metric>(far, depth + 1, p, offset, best_dist, best_node, best_depth, metric);
+      }
     }
   }
 
   template <typename Metric, typename DistanceType>
   void find_closest_k_impl(
-      const Node* node, const IsPoint auto& p, size_t k,
+      NodeIndex node, int depth, const IsPoint auto& p, size_t k,
       DistanceType& best_dist,
-      std::priority_queue<std::pair<DistanceType, const Node*>>& pq,
+      std::priority_queue<std::pair<DistanceType, NodeIndex>>& pq,
       const Metric& metric) const {
-    if (!node) {
+    if (node == kNone) {
       return;
     }
 
-    auto dist = metric.dist(node->entry.p, p);
+    const Node& n = nodes[node];
+    // With k results the far side is often searched too, so start loading both
+    // children while this node is evaluated.
+    prefetch(n.children[0]);
+    prefetch(n.children[1]);
+    auto dist = metric.dist(n.entry.p, p);
     if (dist <= best_dist) {
       pq.push({dist, node});
       if (pq.size() > k) {
@@ -568,149 +804,186 @@ class KDTree {
       }
     }
 
-    int axis = node->depth % 2;
-    int search_first = (p.coords[axis] < node->entry.p.coords[axis]) ? 0 : 1;
-    find_closest_k_impl<Metric>(node->children[search_first].get(), p, k, best_dist, pq, metric);
+    int axis = depth % 2;
+    int search_first = (p.coords[axis] < n.entry.p.coords[axis]) ? 0 : 1;
+    find_closest_k_impl<Metric>(n.children[search_first], depth + 1, p, k, best_dist, pq, metric);
 
-    auto ad = metric.axis_dist(p, node->entry.p, axis);
+    auto ad = metric.axis_dist(p, n.entry.p, axis);
     if (ad <= best_dist) {
-      find_closest_k_impl<Metric>(node->children[!search_first].get(), p, k, best_dist, pq, metric);
+      find_closest_k_impl<Metric>(n.children[!search_first], depth + 1, p, k, best_dist, pq, metric);
     }
   }
 
   template <typename Metric, typename DistanceType>
   void find_all_within_impl(
-      const Node* node, const IsPoint auto& p,
+      NodeIndex node, int depth, const IsPoint auto& p,
       DistanceType radius,
       std::vector<Entry>& results,
       const Metric& metric) const {
-    if (!node) {
+    if (node == kNone) {
       return;
     }
 
-    if (metric.dist(node->entry.p, p) <= radius) {
-      results.push_back(node->entry);
+    const Node& n = nodes[node];
+    // Both sides are searched whenever the radius crosses the split.
+    prefetch(n.children[0]);
+    prefetch(n.children[1]);
+    if (metric.dist(n.entry.p, p) <= radius) {
+      results.push_back(n.entry);
     }
 
-    int axis = node->depth % 2;
-    int search_first = (p.coords[axis] < node->entry.p.coords[axis]) ? 0 : 1;
-    find_all_within_impl<Metric>(node->children[search_first].get(), p, radius, results, metric);
+    int axis = depth % 2;
+    int search_first = (p.coords[axis] < n.entry.p.coords[axis]) ? 0 : 1;
+    find_all_within_impl<Metric>(n.children[search_first], depth + 1, p, radius, results, metric);
 
-    auto ad = metric.axis_dist(p, node->entry.p, axis);
+    auto ad = metric.axis_dist(p, n.entry.p, axis);
     if (ad <= radius) {
-      find_all_within_impl<Metric>(node->children[!search_first].get(), p, radius, results, metric);
+      find_all_within_impl<Metric>(n.children[!search_first], depth + 1, p, radius, results, metric);
     }
   }
 
+  // Like `find_closest_impl`, but returns as soon as any entry is within `radius`.
+  template <typename Metric, typename DistanceType>
+  bool exists_within_impl(
+      NodeIndex node, int depth, const IsPoint auto& p,
+      std::array<DistanceType, 2> offset,
+      DistanceType radius,
+      const Metric& metric) const {
+    const Node& n = nodes[node];
+    if (metric.dist(n.entry.p, p) <= radius) {
+      return true;
+    }
+
+    int axis = depth % 2;
+    int search_first = (p.coords[axis] < n.entry.p.coords[axis]) ? 0 : 1;
+    NodeIndex near = n.children[search_first];
+    NodeIndex far = n.children[!search_first];
+    if (near != kNone && exists_within_impl<Metric>(near, depth + 1, p, offset, radius, metric)) {
+      return true;
+    }
+    if (far == kNone) {
+      return false;
+    }
+    offset[axis] = metric.axis_dist(p, n.entry.p, axis);
+    return (region_dist(offset, axis, metric) <= radius &&
+            exists_within_impl<Metric>(far, depth + 1, p, offset, radius, metric));
+  }
+
   void find_leftmost_along_axis(
-      std::unique_ptr<Node>* node, typename PointType::value_type coord, int axis,
+      NodeIndex* node, int depth, typename PointType::value_type coord, int axis,
       typename PointType::value_type& best_dist,
-      std::unique_ptr<Node>*& best_node) const {
-    if (!*node) {
+      NodeIndex*& best_node, int& best_depth) {
+    if (*node == kNone) {
       return;
     }
 
-    typename PointType::value_type dist = (*node)->entry.p.coords[axis] - coord;
-    if (dist < best_dist ||
-        (dist == best_dist && (!best_node || (*node)->depth > (*best_node)->depth))) {
+    Node& n = nodes[*node];
+    typename PointType::value_type dist = n.entry.p.coords[axis] - coord;
+    if (dist < best_dist || (dist == best_dist && (!best_node || depth > best_depth))) {
       // Prioritizing the deepest means less cascading of intermediate nodes being replaced
       // by deeper nodes, or rebuilding a smaller tree.
       best_dist = dist;
       best_node = node;
+      best_depth = depth;
     }
 
-    find_leftmost_along_axis(&(*node)->children[0], coord, axis, best_dist, best_node);
-    if (axis != (*node)->depth % 2) {
+    find_leftmost_along_axis(&n.children[0], depth + 1, coord, axis, best_dist, best_node, best_depth);
+    if (axis != depth % 2) {
       // No need to search the right side if we're searching along the axis as they have
       // values greater or equal than this node. It's plausible there's a deeper node with
       // equal value, but it's probably not worth the effort to search for. We do need to
       // search the right side for off-axis levels as we make no claim about them.
-      find_leftmost_along_axis(&(*node)->children[1], coord, axis, best_dist, best_node);
+      find_leftmost_along_axis(&n.children[1], depth + 1, coord, axis, best_dist, best_node, best_depth);
     }
   }
 
-  void remove_node(std::unique_ptr<Node>& node) {
-    if (!node) {
+  // `node` is the link (root or a child slot) to the node to remove, which is at
+  // `depth`. Removal never allocates nodes, so links into `nodes` stay valid throughout.
+  void remove_node(NodeIndex& node, int depth) {
+    if (node == kNone) {
       return;
-    } else if (node->children[1]) {
+    } else if (nodes[node].children[1] != kNone) {
       // It is valid to replace this node with any of the leftmost nodes in the right subtree.
       // There may be multiple leftmost nodes, but any will do as they will all sort to the
       // right of any of the others.
-      std::unique_ptr<Node>* best_node = nullptr;
+      NodeIndex* best_node = nullptr;
+      int best_depth = 0;
       typename PointType::value_type best_dist = std::numeric_limits<typename PointType::value_type>::max();
-      int axis = node->depth % 2;
-      typename PointType::value_type coord = node->entry.p.coords[axis];
-      find_leftmost_along_axis(&node->children[1], coord, axis, best_dist, best_node);
+      int axis = depth % 2;
+      typename PointType::value_type coord = nodes[node].entry.p.coords[axis];
+      find_leftmost_along_axis(&nodes[node].children[1], depth + 1, coord, axis,
+                               best_dist, best_node, best_depth);
 
       // If there is a right subtree, there will be a left-most node with value >= this one.
       assert(best_dist >= 0);
       assert(best_node);
 
-      node->entry = (*best_node)->entry;
-      remove_node(*best_node);
+      nodes[node].entry = nodes[*best_node].entry;
+      remove_node(*best_node, best_depth);
       return;
-    } else if (node->children[0]) {
+    } else if (nodes[node].children[0] != kNone) {
       // It is NOT valid to replace this node with the rightmost node of the left subtree,
       // as promoting that node would break the invariant for all nodes that have a value
       // equal to it along that axis, so they'd need to move from the left subtree to the
       // right subtree. Finding/moving all of those would be a pain, so just rebuild instead.
-      int depth = node->depth;
       sum_depth -= depth;
       count -= 1;
-      std::vector<std::unique_ptr<Node>> nodes;
+      std::vector<NodeIndex> indices;
       // Skip collecting this node as it's being removed.
-      collect_nodes(std::move(node->children[0]), nodes);
-      assert(!node->children[1]);  // Otherwise we'd have replaced this node above.
-      node = build_balanced_tree(nodes.begin(), nodes.end(), depth);
+      collect_nodes(nodes[node].children[0], depth + 1, indices);
+      assert(nodes[node].children[1] == kNone);  // Otherwise we'd have replaced this node above.
+      free_node(node);
+      node = build_balanced_tree(indices.begin(), indices.end(), depth);
       return;
     } else {
       // A leaf node can just be removed.
-      sum_depth -= node->depth;
+      sum_depth -= depth;
       count -= 1;
-      node.reset();
+      free_node(node);
+      node = kNone;
       return;
     }
   }
 
-  void print_tree(std::ostream& stream, const Node* node, std::string prefix, bool first) const {
-    if (!node) {
+  void print_tree(std::ostream& stream, NodeIndex node, std::string prefix, bool first) const {
+    if (node == kNone) {
       return;
     }
-    stream << prefix << (first ? "├─" : "└─") << node->entry << std::endl;
+    stream << prefix << (first ? "├─" : "└─") << nodes[node].entry << std::endl;
     prefix += (first ? "│ " : "  ");
-    print_tree(stream, node->children[0].get(), prefix, true);
-    print_tree(stream, node->children[1].get(), prefix, false);
+    print_tree(stream, nodes[node].children[0], prefix, true);
+    print_tree(stream, nodes[node].children[1], prefix, false);
   }
 
-  int64_t validate(const Node* node, int depth, PointType min, PointType max) const;
+  int64_t validate(NodeIndex node, int depth, PointType min, PointType max) const;
 
-  int depth_max(const Node* node) const {
-    if (!node) {
+  int depth_max(NodeIndex node, int depth) const {
+    if (node == kNone) {
       return 0;
     }
     return std::max({
-      node->depth,
-      depth_max(node->children[0].get()),
-      depth_max(node->children[1].get())
+      depth,
+      depth_max(nodes[node].children[0], depth + 1),
+      depth_max(nodes[node].children[1], depth + 1)
     });
   }
 
-  int leaf_count(const Node* node) const {
-    if (!node) {
+  int leaf_count(NodeIndex node) const {
+    if (node == kNone) {
       return 0;
-    } else if (!node->children[0] && !node->children[1]) {
+    } else if (nodes[node].children[0] == kNone && nodes[node].children[1] == kNone) {
       return 1;
     } else {
-      return (leaf_count(node->children[0].get()) +
-              leaf_count(node->children[1].get()));
+      return (leaf_count(nodes[node].children[0]) +
+              leaf_count(nodes[node].children[1]));
     }
   }
 
-  std::pair<int, double> depth_variance(Node* node) const {
-    if (!node) return {0, 0.0};
+  std::pair<int, double> depth_variance(NodeIndex node) const {
+    if (node == kNone) return {0, 0.0};
 
-    auto [left_height, left_variance] = depth_variance(node->children[0].get());
-    auto [right_height, right_variance] = depth_variance(node->children[1].get());
+    auto [left_height, left_variance] = depth_variance(nodes[node].children[0]);
+    auto [right_height, right_variance] = depth_variance(nodes[node].children[1]);
 
     int height = std::max(left_height, right_height) + 1;
     int height_diff = left_height - right_height;
@@ -718,23 +991,27 @@ class KDTree {
     return {height, variance};
   }
 
-  void collect_nodes(std::unique_ptr<Node> node, std::vector<std::unique_ptr<Node>>& nodes) {
-    if (!node) {
+  // Detaches the subtree at `node`, which is at `depth`, appending its nodes to
+  // `indices` for a rebuild.
+  void collect_nodes(NodeIndex node, int depth, std::vector<NodeIndex>& indices) {
+    if (node == kNone) {
       return;
     }
-    collect_nodes(std::move(node->children[0]), nodes);
-    collect_nodes(std::move(node->children[1]), nodes);
-    sum_depth -= node->depth;
+    Node& n = nodes[node];
+    collect_nodes(n.children[0], depth + 1, indices);
+    collect_nodes(n.children[1], depth + 1, indices);
+    n.children[0] = n.children[1] = kNone;
+    sum_depth -= depth;
     count -= 1;
-    nodes.push_back(std::move(node));
+    indices.push_back(node);
   }
 
-  std::unique_ptr<Node> build_balanced_tree(
-      typename std::vector<std::unique_ptr<Node>>::iterator start,
-      typename std::vector<std::unique_ptr<Node>>::iterator end,
+  NodeIndex build_balanced_tree(
+      typename std::vector<NodeIndex>::iterator start,
+      typename std::vector<NodeIndex>::iterator end,
       int depth) {
     if (start == end) {
-      return nullptr;
+      return kNone;
     }
 
     int axis = depth % 2;
@@ -742,25 +1019,92 @@ class KDTree {
     // Choose the pivot.
     auto mid = std::next(start, std::distance(start, end) / 2);
     // Find the pivot value
-    std::nth_element(start, mid, end, [axis](const std::unique_ptr<Node>& a, const std::unique_ptr<Node>& b) {
-      return a->entry.p.coords[axis] < b->entry.p.coords[axis];
+    std::nth_element(start, mid, end, [this, axis](NodeIndex a, NodeIndex b) {
+      return nodes[a].entry.p.coords[axis] < nodes[b].entry.p.coords[axis];
     });
 
-    typename PointType::value_type pivot_coord = (*mid)->entry.p.coords[axis];
+    typename PointType::value_type pivot_coord = nodes[*mid].entry.p.coords[axis];
     // Find the pivot's true location, as it has to be the first of that value.
-    mid = std::partition(start, mid, [axis, pivot_coord](const std::unique_ptr<Node>& a) {
-      return a->entry.p.coords[axis] < pivot_coord;
+    mid = std::partition(start, mid, [this, axis, pivot_coord](NodeIndex a) {
+      return nodes[a].entry.p.coords[axis] < pivot_coord;
     });
 
-    std::unique_ptr<Node> node = std::move(*mid);
-    node->depth = depth;
+    NodeIndex node = *mid;
     sum_depth += depth;
     count += 1;
-    node->children[0] = build_balanced_tree(start, mid, depth + 1);
-    node->children[1] = build_balanced_tree(mid + 1, end, depth + 1);
+    nodes[node].children[0] = build_balanced_tree(start, mid, depth + 1);
+    nodes[node].children[1] = build_balanced_tree(mid + 1, end, depth + 1);
 
     return node;
   }
+
+  // Reorders `nodes` into van Emde Boas order after a full rebuild: the top half of
+  // the levels is stored contiguously, followed by each subtree hanging below it, each
+  // laid out recursively the same way. A root-to-leaf descent then touches O(log_B n)
+  // cache lines instead of O(log n), whatever the line size B. This also drops any
+  // free or unreachable slots.
+  void relayout() {
+    std::vector<NodeIndex> order;
+    if (root != kNone) {
+      order.reserve(count);
+      std::vector<NodeIndex> scratch;
+      veb_order(root, static_cast<int>(depth_max()) + 1, order, scratch);
+    }
+    assert(order.size() == size());
+
+    std::vector<NodeIndex> remap(nodes.size(), kNone);
+    for (size_t i = 0; i < order.size(); ++i) {
+      remap[order[i]] = static_cast<NodeIndex>(i);
+    }
+
+    std::vector<Node> relaid;
+    relaid.reserve(std::max(order.size(), reserved));
+    for (NodeIndex index : order) {
+      Node& n = nodes[index];
+      for (NodeIndex& child : n.children) {
+        if (child != kNone) {
+          child = remap[child];
+        }
+      }
+      relaid.push_back(std::move(n));
+    }
+
+    nodes = std::move(relaid);
+    free_nodes.clear();
+    root = (root == kNone ? kNone : 0);
+  }
+
+  // Appends the subtree at `node`, of at most `height` levels, to `order` in van Emde
+  // Boas order. `scratch` is shared across the recursion to avoid allocating per call.
+  void veb_order(NodeIndex node, int height, std::vector<NodeIndex>& order,
+                 std::vector<NodeIndex>& scratch) const {
+    if (height == 1) {
+      order.push_back(node);
+      return;
+    }
+    int top = height / 2;
+    veb_order(node, top, order, scratch);
+
+    size_t start = scratch.size();
+    subtrees_at(node, top, scratch);
+    size_t end = scratch.size();
+    for (size_t i = start; i < end; ++i) {
+      veb_order(scratch[i], height - top, order, scratch);
+    }
+    scratch.resize(start);
+  }
+
+  // Appends the roots of the subtrees `depth` levels below `node`, left to right.
+  void subtrees_at(NodeIndex node, int depth, std::vector<NodeIndex>& out) const {
+    if (node == kNone) {
+      return;
+    } else if (depth == 0) {
+      out.push_back(node);
+    } else {
+      subtrees_at(nodes[node].children[0], depth - 1, out);
+      subtrees_at(nodes[node].children[1], depth - 1, out);
+    }
+  }
 };
 
 using KDTreei = KDTree<Pointi, int64_t>;
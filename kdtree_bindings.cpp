@@ -4,8 +4,10 @@
 // See the License at http://www.apache.org/licenses/LICENSE-2.0
 
 #include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
 #include <pybind11/stl.h>
 #include <pybind11/operators.h>
+#include <atomic>
 #include <sstream>
 #include "kdtree.h"
 
@@ -17,6 +19,17 @@ template<typename PointType>
 PointType to_point(py::handle obj) {
     using T = typename PointType::value_type;
 
+    // Tuples and lists are the common case in query loops. Check them first with the
+    // cheap CPython type checks and read the items in place, before paying for the
+    // registered-type lookups below.
+    if (PyTuple_Check(obj.ptr()) || PyList_Check(obj.ptr())) {
+        if (PySequence_Fast_GET_SIZE(obj.ptr()) != 2) {
+            throw std::runtime_error("Point requires exactly 2 coordinates");
+        }
+        PyObject** items = PySequence_Fast_ITEMS(obj.ptr());
+        return PointType(py::handle(items[0]).cast<T>(), py::handle(items[1]).cast<T>());
+    }
+
     if (py::isinstance<PointType>(obj)) {
         return obj.cast<PointType>();
     }
@@ -29,13 +42,9 @@ PointType to_point(py::handle obj) {
         auto p = obj.cast<Pointd>();
         return PointType(static_cast<T>(p.x), static_cast<T>(p.y));
     }
-
-    if (py::isinstance<py::tuple>(obj) || py::isinstance<py::list>(obj)) {
-        auto seq = obj.cast<py::sequence>();
-        if (seq.size() != 2) {
-            throw std::runtime_error("Point requires exactly 2 coordinates");
-        }
-        return PointType(seq[0].cast<T>(), seq[1].cast<T>());
+    if (py::isinstance<Pointf>(obj)) {
+        auto p = obj.cast<Pointf>();
+        return PointType(static_cast<T>(p.x), static_cast<T>(p.y));
     }
 
     if (py::isinstance<py::buffer>(obj)) {
@@ -57,27 +66,272 @@ PointType to_point(py::handle obj) {
     throw std::runtime_error("Cannot convert to Point - expected Point, tuple, list, or 1D buffer of size 2");
 }
 
-// Helper to dispatch to the correct metric type and execute a function
+// Helper to convert an Nx2 coordinate array and matching values into entries.
+// Coordinates are converted to the tree's coordinate type if needed.
+template<typename PointType, typename ValueType>
+std::vector<Entry<PointType, ValueType>> to_entries(py::handle coords, py::handle values) {
+    using T = typename PointType::value_type;
+
+    auto coords_arr = py::array_t<T, py::array::c_style | py::array::forcecast>::ensure(coords);
+    if (!coords_arr || coords_arr.ndim() != 2 || coords_arr.shape(1) != 2) {
+        throw std::runtime_error("Coordinates must be an Nx2 array");
+    }
+    auto c = coords_arr.template unchecked<2>();
+    size_t n = c.shape(0);
+
+    std::vector<Entry<PointType, ValueType>> entries;
+    entries.reserve(n);
+
+    if constexpr (std::is_arithmetic_v<ValueType>) {
+        auto val_arr = py::array_t<ValueType, py::array::c_style | py::array::forcecast>::ensure(values);
+        if (!val_arr || val_arr.size() != (ssize_t)n) {
+            throw std::runtime_error("Values length must match coordinates");
+        }
+        const ValueType* val_ptr = val_arr.data();
+        for (size_t i = 0; i < n; ++i) {
+            entries.push_back({PointType(c(i, 0), c(i, 1)), val_ptr[i]});
+        }
+    } else {
+        auto val_seq = values.cast<py::sequence>();
+        if (val_seq.size() != n) {
+            throw std::runtime_error("Values length must match coordinates");
+        }
+        for (size_t i = 0; i < n; ++i) {
+            entries.push_back({PointType(c(i, 0), c(i, 1)), val_seq[i].cast<ValueType>()});
+        }
+    }
+    return entries;
+}
+
+// Helper to run `f` with the GIL released, unless the values are Python objects which
+// need the GIL for reference counting.
+template<typename ValueType, typename Func>
+auto without_gil(Func&& f) {
+    if constexpr (std::is_same_v<ValueType, py::object>) {
+        return f();
+    } else {
+        py::gil_scoped_release release;
+        return f();
+    }
+}
+
+// Tree of numeric values. `find_closest_batch` reads it with the GIL released, so it
+// counts the batches in flight and the methods that change the tree refuse to run
+// meanwhile. The count is only touched with the GIL held.
+template<typename PointType, typename ValueType>
+class KDTreeNum : public KDTree<PointType, ValueType> {
+  public:
+    using KDTree<PointType, ValueType>::KDTree;
+    mutable int batches = 0;
+};
+
+// Helper to throw if `tree` is being read by `find_closest_batch` without the GIL.
+template<typename Tree>
+void check_writable(const Tree& tree) {
+    if constexpr (requires { tree.batches; }) {
+        if (tree.batches > 0) {
+            throw std::runtime_error("Can't modify the tree while find_closest_batch is running");
+        }
+    }
+}
+
+// Tree of Python objects. The objects live in a slot table and the tree only stores
+// their slot index, so nodes stay plain data: moving nodes during rebalance or
+// relayout never touches a reference count, and inserting or removing a point changes
+// only the one reference it adds or drops. Mirrors the KDTree interface used by
+// `bind_kdtree`, translating slots back to objects in the results.
+template<typename PointType>
+class KDTreePy {
+  public:
+    using Slot = uint32_t;
+    using Tree = KDTree<PointType, Slot>;
+    using Entry = kdtree::Entry<PointType, py::object>;
+
+    class Iterator {
+      public:
+        Iterator() {}
+        Iterator(typename Tree::Iterator it, const std::vector<py::object>* values)
+            : it(it), values(values) {}
+
+        Entry operator*() const { return {it->p, (*values)[it->value]}; }
+        Iterator& operator++() {
+            ++it;
+            return *this;
+        }
+        bool operator==(const Iterator& o) const { return it == o.it; }
+        bool operator!=(const Iterator& o) const { return it != o.it; }
+      private:
+        typename Tree::Iterator it;
+        const std::vector<py::object>* values = nullptr;
+    };
+
+    KDTreePy() {}
+    KDTreePy(const std::vector<Entry>& entries) { insert_many(entries); }
+
+    bool empty() const { return tree.empty(); }
+    size_t size() const { return tree.size(); }
+    void clear() {
+        tree.clear();
+        values.clear();
+        free_slots.clear();
+    }
+    void reserve(size_t n) {
+        tree.reserve(n);
+        values.reserve(n);
+    }
+
+    Iterator begin() const { return Iterator(tree.begin(), &values); }
+    Iterator end() const { return Iterator(tree.end(), &values); }
+
+    bool insert(PointType p, py::object v) {
+        Slot slot = new_slot(std::move(v));
+        if (tree.insert(p, slot)) {
+            return true;
+        }
+        free_slot(slot);
+        return false;
+    }
+
+    size_t insert_many(const std::vector<Entry>& entries) {
+        std::vector<typename Tree::Entry> slotted;
+        slotted.reserve(entries.size());
+        for (const auto& e : entries) {
+            slotted.push_back({e.p, new_slot(e.value)});
+        }
+        size_t inserted = tree.insert_many(slotted);
+        if (inserted < slotted.size()) {
+            // Free the slots of entries dropped as duplicates.
+            for (const auto& e : slotted) {
+                if (tree.find(e.p)->value != e.value) {
+                    free_slot(e.value);
+                }
+            }
+        }
+        return inserted;
+    }
+
+    bool remove(PointType p) {
+        auto e = tree.find(p);
+        if (!e) {
+            return false;
+        }
+        tree.remove(p);
+        free_slot(e->value);
+        return true;
+    }
+
+    bool exists(PointType p) const { return tree.exists(p); }
+    std::optional<Entry> find(PointType p) const { return to_entry(tree.find(p)); }
+
+    template <typename Metric>
+    std::optional<Entry> find_closest(const IsPoint auto& p, const Metric& metric, double max_dist) const {
+        return to_entry(tree.find_closest(p, metric, max_dist));
+    }
+
+    template <typename Metric>
+    std::vector<Entry> find_closest_k(const IsPoint auto& p, size_t k, const Metric& metric, double max_dist) const {
+        return to_entries(tree.find_closest_k(p, k, metric, max_dist));
+    }
+
+    template <typename Metric>
+    std::vector<Entry> find_all_within(const IsPoint auto& p, const Metric& metric, double radius) const {
+        return to_entries(tree.find_all_within(p, metric, radius));
+    }
+
+    template <typename Metric>
+    bool exists_within(const IsPoint auto& p, const Metric& metric, double radius) const {
+        return tree.exists_within(p, metric, radius);
+    }
+
+    template <typename Metric>
+    std::optional<Entry> pop_closest(const IsPoint auto& p, const Metric& metric, double max_dist) {
+        auto e = tree.pop_closest(p, metric, max_dist);
+        if (!e) {
+            return std::nullopt;
+        }
+        Entry out(e->p, std::move(values[e->value]));
+        free_slot(e->value);
+        return out;
+    }
+
+    void rebalance() { tree.rebalance(); }
+    std::string balance_str() const { return tree.balance_str(); }
+    size_t depth_max() const { return tree.depth_max(); }
+    double depth_avg() const { return tree.depth_avg(); }
+    double depth_stddev() const { return tree.depth_stddev(); }
+    double balance_factor() const { return tree.balance_factor(); }
+
+  private:
+    Tree tree;
+    std::vector<py::object> values;  // Indexed by slot. Free slots hold a null object.
+    std::vector<Slot> free_slots;
+
+    Slot new_slot(py::object v) {
+        if (!free_slots.empty()) {
+            Slot slot = free_slots.back();
+            free_slots.pop_back();
+            values[slot] = std::move(v);
+            return slot;
+        }
+        values.push_back(std::move(v));
+        return static_cast<Slot>(values.size() - 1);
+    }
+
+    void free_slot(Slot slot) {
+        values[slot] = py::object();
+        free_slots.push_back(slot);
+    }
+
+    std::optional<Entry> to_entry(const std::optional<typename Tree::Entry>& e) const {
+        if (!e) {
+            return std::nullopt;
+        }
+        return Entry(e->p, values[e->value]);
+    }
+
+    std::vector<Entry> to_entries(const std::vector<typename Tree::Entry>& slotted) const {
+        std::vector<Entry> out;
+        out.reserve(slotted.size());
+        for (const auto& e : slotted) {
+            out.emplace_back(e.p, values[e.value]);
+        }
+        return out;
+    }
+};
+
+// Helper to check a metric's type. The exact check is a pointer compare against the
+// registered type, looked up once; `py::isinstance` costs a registry lookup per call.
+template<typename Metric>
+bool is_metric(py::handle handle, bool exact) {
+    static PyTypeObject* type = reinterpret_cast<PyTypeObject*>(py::type::of<Metric>().ptr());
+    return exact ? Py_TYPE(handle.ptr()) == type : py::isinstance<Metric>(handle);
+}
+
+// Helper to dispatch to the correct metric type and execute a function. Metrics are
+// matched by exact type first, then again allowing Python subclasses.
 template<typename Func>
-auto dispatch_metric(py::handle handle, Func&& f) {
-    if (handle.is_none() || py::isinstance<L2sq>(handle))
-        return f(handle.is_none() ? L2sq{} : handle.cast<L2sq>());
-    if (py::isinstance<L1>(handle))
-        return f(handle.cast<L1>());
-    if (py::isinstance<L2>(handle))
-        return f(handle.cast<L2>());
-    if (py::isinstance<Linf>(handle))
-        return f(handle.cast<Linf>());
-    if (py::isinstance<Toroidal<L1, double>>(handle))
+auto dispatch_metric(py::handle handle, Func&& f, bool exact = true) {
+    // The plain metrics hold no state, so construct them rather than cast.
+    if (handle.is_none() || is_metric<L2sq>(handle, exact))
+        return f(L2sq{});
+    if (is_metric<L1>(handle, exact))
+        return f(L1{});
+    if (is_metric<L2>(handle, exact))
+        return f(L2{});
+    if (is_metric<Linf>(handle, exact))
+        return f(Linf{});
+    if (is_metric<Toroidal<L1, double>>(handle, exact))
         return f(handle.cast<Toroidal<L1, double>>());
-    if (py::isinstance<Toroidal<L2, double>>(handle))
+    if (is_metric<Toroidal<L2, double>>(handle, exact))
         return f(handle.cast<Toroidal<L2, double>>());
-    if (py::isinstance<Toroidal<L2sq, double>>(handle))
+    if (is_metric<Toroidal<L2sq, double>>(handle, exact))
         return f(handle.cast<Toroidal<L2sq, double>>());
-    if (py::isinstance<Toroidal<Linf, double>>(handle))
+    if (is_metric<Toroidal<Linf, double>>(handle, exact))
         return f(handle.cast<Toroidal<Linf, double>>());
-    if (py::isinstance<GreatCircle>(handle))
+    if (is_metric<GreatCircle>(handle, exact))
         return f(handle.cast<GreatCircle>());
+    if (exact)
+        return dispatch_metric(handle, std::forward<Func>(f), false);
     throw py::type_error("Unsupported metric type");
 }
 
@@ -91,53 +345,46 @@ void add_dist(py::class_<Metric>& cl) {
 
 template<typename PointType, typename ValueType>
 void bind_kdtree(py::module_& m, const std::string& name) {
-    using Tree = KDTree<PointType, ValueType>;
+    using Tree = std::conditional_t<std::is_same_v<ValueType, py::object>,
+                                    KDTreePy<PointType>, KDTreeNum<PointType, ValueType>>;
     using Entry = typename Tree::Entry;
-    using T = typename PointType::value_type;
 
-    py::class_<Tree>(m, name.c_str())
+    auto cl = py::class_<Tree>(m, name.c_str())
         .def(py::init<>())
         .def(py::init<const std::vector<Entry>&>())
-        .def(py::init([](py::buffer coords, py::handle values) {
-            py::buffer_info coords_info = coords.request();
-            if (coords_info.ndim != 2 || coords_info.shape[1] != 2) {
-                throw std::runtime_error("Coordinates must be an Nx2 array");
-            }
-            size_t n = coords_info.shape[0];
-            const T* coords_ptr = static_cast<const T*>(coords_info.ptr);
-
-            std::vector<Entry> entries;
-            entries.reserve(n);
-
-            if (py::isinstance<py::buffer>(values)) {
-                py::buffer_info val_info = values.cast<py::buffer>().request();
-                if (val_info.size != (ssize_t)n) {
-                    throw std::runtime_error("Values length must match coordinates");
-                }
-                const ValueType* val_ptr = static_cast<const ValueType*>(val_info.ptr);
-                for (size_t i = 0; i < n; ++i) {
-                    entries.push_back({PointType(coords_ptr[i*2], coords_ptr[i*2+1]), val_ptr[i]});
-                }
-            } else {
-                auto val_seq = values.cast<py::sequence>();
-                if (val_seq.size() != n) {
-                    throw std::runtime_error("Values length must match coordinates");
-                }
-                for (size_t i = 0; i < n; ++i) {
-                    entries.push_back({PointType(coords_ptr[i*2], coords_ptr[i*2+1]), val_seq[i].cast<ValueType>()});
-                }
-            }
-            return new Tree(entries);
-        }))
+        .def(py::init([](py::handle coords, py::handle values) {
+            auto entries = to_entries<PointType, ValueType>(coords, values);
+            return without_gil<ValueType>([&] { return new Tree(entries); });
+        }), py::arg("coords"), py::arg("values"))
         .def("empty", &Tree::empty)
         .def("size", &Tree::size)
-        .def("clear", &Tree::clear)
+        .def("clear", [](Tree& self) {
+            check_writable(self);
+            self.clear();
+        })
+        .def("reserve", [](Tree& self, size_t n) {
+            check_writable(self);
+            self.reserve(n);
+        }, py::arg("n"))
 
+        // Mutators convert their arguments before `check_writable`, since converting can
+        // run Python code that lets a `find_closest_batch` start.
         .def("insert", [](Tree& self, py::handle point_like, ValueType val) {
-            return self.insert(to_point<PointType>(point_like), val);
+            auto p = to_point<PointType>(point_like);
+            check_writable(self);
+            return self.insert(p, val);
         }, py::arg("point"), py::arg("value"))
+        // Holds the GIL, unlike the constructor: this tree may already be shared with
+        // other threads, which must not see it mid-rebuild.
+        .def("insert_many", [](Tree& self, py::handle coords, py::handle values) {
+            auto entries = to_entries<PointType, ValueType>(coords, values);
+            check_writable(self);
+            return self.insert_many(entries);
+        }, py::arg("coords"), py::arg("values"))
         .def("remove", [](Tree& self, py::handle point_like) {
-            return self.remove(to_point<PointType>(point_like));
+            auto p = to_point<PointType>(point_like);
+            check_writable(self);
+            return self.remove(p);
         }, py::arg("point"))
         .def("exists", [](const Tree& self, py::handle point_like) {
             return self.exists(to_point<PointType>(point_like));
@@ -172,14 +419,27 @@ void bind_kdtree(py::module_& m, const std::string& name) {
             });
         }, py::arg("point"), py::arg("metric"), py::arg("radius"))
 
+        .def("exists_within", [](const Tree& self, py::handle point_like, py::handle metric, double radius) {
+            if (metric.is_none())
+                throw py::value_error("Metric must be specified for exists_within");
+            return dispatch_metric(metric, [&](const auto& m) {
+                return self.template exists_within(to_point<PointType>(point_like), m, radius);
+            });
+        }, py::arg("point"), py::arg("metric"), py::arg("radius"))
+
         .def("pop_closest", [](Tree& self, py::handle point_like, py::handle metric, py::handle max_dist) -> std::optional<Entry> {
             double limit = max_dist.is_none() ? -1.0 : max_dist.cast<double>();
+            auto p = to_point<PointType>(point_like);
             return dispatch_metric(metric, [&](const auto& m) -> std::optional<Entry> {
-                return self.template pop_closest(to_point<PointType>(point_like), m, limit);
+                check_writable(self);
+                return self.template pop_closest(p, m, limit);
             });
         }, py::arg("point"), py::arg("metric") = py::none(), py::arg("max_dist") = py::none())
 
-        .def("rebalance", &Tree::rebalance)
+        .def("rebalance", [](Tree& self) {
+            check_writable(self);
+            self.rebalance();
+        })
         .def("balance_str", &Tree::balance_str)
         .def("depth_max", static_cast<size_t (Tree::*)() const>(&Tree::depth_max))
         .def("depth_avg", &Tree::depth_avg)
@@ -191,6 +451,49 @@ void bind_kdtree(py::module_& m, const std::string& name) {
         .def("__iter__", [](const Tree& t) {
             return py::make_iterator(t.begin(), t.end());
         }, py::keep_alive<0, 1>());
+
+    if constexpr (std::is_arithmetic_v<ValueType>) {
+        // Answers many queries in one call with the GIL released, and in parallel when
+        // built with OpenMP. Not offered for Python object values, which need the GIL.
+        // Raises if any query has no closest entry, such as one with NaN coordinates.
+        cl.def("find_closest_batch", [](const Tree& self, py::handle points, py::handle metric) {
+            using T = typename PointType::value_type;
+            auto arr = py::array_t<T, py::array::c_style | py::array::forcecast>::ensure(points);
+            if (!arr || arr.ndim() != 2 || arr.shape(1) != 2) {
+                throw std::runtime_error("Points must be an Nx2 array");
+            }
+            if (self.empty()) {
+                throw py::value_error("find_closest_batch requires a non-empty tree");
+            }
+            py::ssize_t n = arr.shape(0);
+            py::array_t<ValueType> result(n);
+            const T* in = arr.data();
+            ValueType* out = result.mutable_data();
+            std::atomic<bool> missing = false;
+            dispatch_metric(metric, [&](const auto& m) {
+                self.batches += 1;
+                {
+                    py::gil_scoped_release release;
+#ifdef _OPENMP
+                    #pragma omp parallel for schedule(static)
+#endif
+                    for (py::ssize_t i = 0; i < n; ++i) {
+                        auto e = self.find_closest(PointType(in[2 * i], in[2 * i + 1]), m, -1);
+                        if (e) {
+                            out[i] = e->value;
+                        } else {
+                            missing.store(true, std::memory_order_relaxed);
+                        }
+                    }
+                }
+                self.batches -= 1;
+            });
+            if (missing) {
+                throw py::value_error("find_closest_batch found no entry for a query, e.g. one with NaN coordinates");
+            }
+            return result;
+        }, py::arg("points"), py::arg("metric") = py::none());
+    }
 }
 
 template<typename T>
@@ -267,14 +570,18 @@ PYBIND11_MODULE(kdtree, m) {
 
     bind_point<int>(m, "Pointi");
     bind_point<double>(m, "Pointd");
+    bind_point<float>(m, "Pointf");
 
     bind_entry<Pointi, int64_t>(m, "Entryi");
     bind_entry<Pointd, int64_t>(m, "Entryd");
+    bind_entry<Pointf, int64_t>(m, "Entryf");
     bind_entry<Pointi, py::object>(m, "EntryPyi");
     bind_entry<Pointd, py::object>(m, "EntryPyd");
 
     bind_kdtree<Pointi, int64_t>(m, "KDTreei");
     bind_kdtree<Pointd, int64_t>(m, "KDTreed");
+    // Float coordinates: smaller nodes for inputs that don't need double precision.
+    bind_kdtree<Pointf, int64_t>(m, "KDTreef");
 
     bind_kdtree<Pointi, py::object>(m, "KDTreePyi");
     bind_kdtree<Pointd, py::object>(m, "KDTreePyd");
@@ -0,0 +1,344 @@
+"""Numba implementation of the kdtree API, for when the C++ extension can't be built.
+
+    try:
+        import kdtree
+    except ImportError:
+        import kdtree_numba as kdtree
+
+Trees are built once from arrays and support the query side of the API: `find`,
+`exists`, `find_closest`, `find_closest_batch`, `remove` and `pop_closest`. There is
+no `insert`; build a new tree instead. Values must be numeric.
+
+The tree is stored implicitly: points are ordered so that each node is the median of
+its range along its axis, with its children in the halves either side, the same shape
+`build_balanced_tree` produces. Removed points are marked dead and each node counts
+the live points below it, so searches skip emptied subtrees.
+
+Without Numba installed the same code runs as plain Python, which is only practical
+for small trees.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
+    prange = range
+
+__all__ = [
+    "Entry", "KDTreed", "KDTreei", "L1", "L2", "L2sq", "Linf", "Point",
+]
+
+Point = namedtuple("Point", ["x", "y"])
+Entry = namedtuple("Entry", ["p", "value"])
+
+_L2SQ, _L1, _L2, _LINF = range(4)
+_MAX_DEPTH = 64  # Balanced, so depth is at most log2(n) + 1.
+
+
+class _Metric:
+    code = _L2SQ
+
+    def dist(self, a, b):
+        return float(_dist(float(a[0]) - b[0], float(a[1]) - b[1], self.code))
+
+
+class L2sq(_Metric):
+    code = _L2SQ
+
+
+class L1(_Metric):
+    code = _L1
+
+
+class L2(_Metric):
+    code = _L2
+
+
+class Linf(_Metric):
+    code = _LINF
+
+
+@njit(cache=True)
+def _dist(dx, dy, metric):
+    if metric == _L1:
+        return abs(dx) + abs(dy)
+    elif metric == _L2:
+        return np.sqrt(dx * dx + dy * dy)
+    elif metric == _LINF:
+        return max(abs(dx), abs(dy))
+    return dx * dx + dy * dy
+
+
+@njit(cache=True)
+def _axis_dist(d, metric):
+    if metric == _L2SQ:
+        return d * d
+    return abs(d)
+
+
+@njit(cache=True)
+def _build(coords):
+    """Returns the order of `coords` that lays them out as a balanced tree."""
+    n = coords.shape[0]
+    order = np.arange(n)
+    los = [0]
+    his = [n]
+    depths = [0]
+    while len(los) > 0:
+        lo = los.pop()
+        hi = his.pop()
+        depth = depths.pop()
+        if hi - lo <= 1:
+            continue
+        seg = order[lo:hi].copy()
+        keys = coords[:, depth % 2][seg]
+        order[lo:hi] = seg[np.argsort(keys, kind="mergesort")]
+        mid = (lo + hi) // 2
+        los.append(lo)
+        his.append(mid)
+        depths.append(depth + 1)
+        los.append(mid + 1)
+        his.append(hi)
+        depths.append(depth + 1)
+    return order
+
+
+@njit(cache=True)
+def _subtree_sizes(n):
+    counts = np.zeros(n, np.int64)
+    los = [0]
+    his = [n]
+    while len(los) > 0:
+        lo = los.pop()
+        hi = his.pop()
+        if lo >= hi:
+            continue
+        mid = (lo + hi) // 2
+        counts[mid] = hi - lo
+        los.append(lo)
+        his.append(mid)
+        los.append(mid + 1)
+        his.append(hi)
+    return counts
+
+
+@njit(cache=True)
+def _find(pts, alive, x, y):
+    """Returns the index of the live point at (x, y), or -1."""
+    # Points equal to a split can be on either side, so both may need searching.
+    los = np.empty(2 * _MAX_DEPTH, np.int64)
+    his = np.empty(2 * _MAX_DEPTH, np.int64)
+    depths = np.empty(2 * _MAX_DEPTH, np.int64)
+    los[0], his[0], depths[0] = 0, pts.shape[0], 0
+    top = 1
+    while top > 0:
+        top -= 1
+        lo, hi, depth = los[top], his[top], depths[top]
+        if lo >= hi:
+            continue
+        mid = (lo + hi) // 2
+        if alive[mid] and pts[mid, 0] == x and pts[mid, 1] == y:
+            return mid
+        split = pts[mid, depth % 2]
+        q = x if depth % 2 == 0 else y
+        if q <= split:
+            los[top], his[top], depths[top] = lo, mid, depth + 1
+            top += 1
+        if q >= split:
+            los[top], his[top], depths[top] = mid + 1, hi, depth + 1
+            top += 1
+    return -1
+
+
+@njit(cache=True)
+def _find_closest(pts, counts, alive, x, y, metric, max_dist):
+    """Returns the index of the live point closest to (x, y), or -1. Distances are
+    computed in float64 so int coordinates can't overflow."""
+    best = np.inf if max_dist < 0 else max_dist
+    best_i = -1
+    los = np.empty(2 * _MAX_DEPTH, np.int64)
+    his = np.empty(2 * _MAX_DEPTH, np.int64)
+    depths = np.empty(2 * _MAX_DEPTH, np.int64)
+    bounds = np.empty(2 * _MAX_DEPTH, np.float64)
+    los[0], his[0], depths[0], bounds[0] = 0, pts.shape[0], 0, 0.0
+    top = 1
+    while top > 0:
+        top -= 1
+        lo, hi, depth, bound = los[top], his[top], depths[top], bounds[top]
+        if lo >= hi:
+            continue
+        mid = (lo + hi) // 2
+        # Once there is a match, a region no closer than it can only hold ties.
+        if counts[mid] == 0 or bound > best or (bound == best and best_i >= 0):
+            continue
+        if alive[mid]:
+            d = _dist(np.float64(pts[mid, 0]) - x, np.float64(pts[mid, 1]) - y, metric)
+            if d <= best:
+                best = d
+                best_i = mid
+
+        axis = depth % 2
+        diff = (x if axis == 0 else y) - np.float64(pts[mid, axis])
+        far_bound = max(bound, _axis_dist(diff, metric))
+        # Push the far side first so the near side is searched first.
+        if diff < 0:
+            los[top], his[top], depths[top], bounds[top] = mid + 1, hi, depth + 1, far_bound
+            los[top + 1], his[top + 1], depths[top + 1], bounds[top + 1] = lo, mid, depth + 1, bound
+        else:
+            los[top], his[top], depths[top], bounds[top] = lo, mid, depth + 1, far_bound
+            los[top + 1], his[top + 1], depths[top + 1], bounds[top + 1] = mid + 1, hi, depth + 1, bound
+        top += 2
+    return best_i
+
+
+@njit(parallel=True, cache=True)
+def _find_closest_batch(pts, counts, alive, queries, metric):
+    out = np.empty(queries.shape[0], np.int64)
+    for i in prange(queries.shape[0]):
+        x = np.float64(queries[i, 0])
+        y = np.float64(queries[i, 1])
+        out[i] = _find_closest(pts, counts, alive, x, y, metric, -1.0)
+    return out
+
+
+@njit(cache=True)
+def _kill(counts, alive, i):
+    """Marks node `i` dead and updates the live counts on its path from the root."""
+    alive[i] = False
+    lo, hi = 0, counts.shape[0]
+    while True:
+        mid = (lo + hi) // 2
+        counts[mid] -= 1
+        if mid == i:
+            return
+        if i < mid:
+            hi = mid
+        else:
+            lo = mid + 1
+
+
+def _metric_code(metric):
+    if metric is None:
+        return _L2SQ
+    if isinstance(metric, _Metric):
+        return metric.code
+    raise TypeError("Unsupported metric type")
+
+
+class _KDTree:
+    _coord_dtype = np.float64
+
+    def __init__(self, coords=None, values=None):
+        if coords is None:
+            coords = np.zeros((0, 2), self._coord_dtype)
+            values = np.zeros(0, np.int64)
+        coords = np.ascontiguousarray(coords, dtype=self._coord_dtype)
+        if coords.ndim != 2 or coords.shape[1] != 2:
+            raise RuntimeError("Coordinates must be an Nx2 array")
+        values = np.ascontiguousarray(values, dtype=np.int64)
+        if values.shape != (coords.shape[0],):
+            raise RuntimeError("Values length must match coordinates")
+
+        # Like the C++ tree, the first of any duplicate points is kept.
+        _, first = np.unique(coords, axis=0, return_index=True)
+        first.sort()
+        coords, values = coords[first], values[first]
+
+        order = _build(coords)
+        self._pts = coords[order]
+        self._values = values[order]
+        self._counts = _subtree_sizes(len(order))
+        self._alive = np.ones(len(order), np.bool_)
+
+    def _point(self, point):
+        if len(point) != 2:
+            raise RuntimeError("Point requires exactly 2 coordinates")
+        t = self._coord_dtype
+        return t(point[0]), t(point[1])
+
+    def _entry(self, i):
+        return Entry(Point(*self._pts[i].tolist()), int(self._values[i]))
+
+    def __len__(self):
+        return int(self._counts[len(self._counts) // 2]) if len(self._counts) else 0
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        for i in np.flatnonzero(self._alive):
+            yield self._entry(i)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(size: {len(self)})"
+
+    def size(self):
+        return len(self)
+
+    def empty(self):
+        return len(self) == 0
+
+    def find(self, point):
+        i = _find(self._pts, self._alive, *self._point(point))
+        return self._entry(i) if i >= 0 else None
+
+    def exists(self, point):
+        return _find(self._pts, self._alive, *self._point(point)) >= 0
+
+    def remove(self, point):
+        i = _find(self._pts, self._alive, *self._point(point))
+        if i < 0:
+            return False
+        _kill(self._counts, self._alive, i)
+        return True
+
+    def _closest(self, point, metric, max_dist):
+        limit = -1.0 if max_dist is None else float(max_dist)
+        if limit >= 0 and metric is None:
+            raise ValueError("Metric must be specified when max_dist is provided")
+        if self.empty():
+            return -1
+        x, y = self._point(point)
+        return _find_closest(self._pts, self._counts, self._alive, float(x), float(y),
+                             _metric_code(metric), limit)
+
+    def find_closest(self, point, metric=None, max_dist=None):
+        i = self._closest(point, metric, max_dist)
+        return self._entry(i) if i >= 0 else None
+
+    def pop_closest(self, point, metric=None, max_dist=None):
+        i = self._closest(point, metric, max_dist)
+        if i < 0:
+            return None
+        _kill(self._counts, self._alive, i)
+        return self._entry(i)
+
+    def find_closest_batch(self, points, metric=None):
+        queries = np.ascontiguousarray(points, dtype=self._coord_dtype)
+        if queries.ndim != 2 or queries.shape[1] != 2:
+            raise RuntimeError("Points must be an Nx2 array")
+        if self.empty():
+            raise ValueError("find_closest_batch requires a non-empty tree")
+        indices = _find_closest_batch(self._pts, self._counts, self._alive, queries,
+                                      _metric_code(metric))
+        if (indices < 0).any():
+            raise ValueError("find_closest_batch found no entry for a query, e.g. one "
+                             "with NaN coordinates")
+        return self._values[indices]
+
+
+class KDTreed(_KDTree):
+    """Tree with double coordinates and int64 values."""
+    _coord_dtype = np.float64
+
+
+class KDTreei(_KDTree):
+    """Tree with int coordinates and int64 values."""
+    _coord_dtype = np.int32
@@ -34,31 +34,35 @@ auto c_find(Container& c, const T& value) {
 // Implement validate() for all template instantiations
 template<IsPoint PointType, class ValueType>
 void KDTree<PointType, ValueType>::validate() const {
+  static_assert(sizeof(Node) == sizeof(Entry) + 2 * sizeof(NodeIndex));  // No padding.
   auto min = std::numeric_limits<typename PointType::value_type>::lowest();
   auto max = std::numeric_limits<typename PointType::value_type>::max();
-  int64_t true_sum_depth = validate(root.get(), 0, {min, min}, {max, max});
+  int64_t true_sum_depth = validate(root, 0, {min, min}, {max, max});
   REQUIRE(sum_depth == true_sum_depth);
+  REQUIRE(nodes.size() == size() + free_nodes.size());
 }
 
 template<IsPoint PointType, class ValueType>
-int64_t KDTree<PointType, ValueType>::validate(const Node* node, int depth, PointType min, PointType max) const {
-  if (!node) {
+int64_t KDTree<PointType, ValueType>::validate(NodeIndex node, int depth, PointType min, PointType max) const {
+  if (node == kNone) {
     return 0;
   }
 
-  REQUIRE(node->depth == depth);
-  REQUIRE(node->entry.p.x >= min.x);
-  REQUIRE(node->entry.p.y >= min.y);
-  REQUIRE(node->entry.p.x < max.x);
-  REQUIRE(node->entry.p.y < max.y);
+  REQUIRE(node < nodes.size());
+  REQUIRE(!c_linear_search(free_nodes, node));
+  const Node& n = nodes[node];
+  REQUIRE(n.entry.p.x >= min.x);
+  REQUIRE(n.entry.p.y >= min.y);
+  REQUIRE(n.entry.p.x < max.x);
+  REQUIRE(n.entry.p.y < max.y);
 
   int64_t sum_depth = depth;
   if (depth % 2 == 0) {
-    sum_depth += validate(node->children[0].get(), depth + 1, min, {node->entry.p.x, max.y});
-    sum_depth += validate(node->children[1].get(), depth + 1, {node->entry.p.x, min.y}, max);
+    sum_depth += validate(n.children[0], depth + 1, min, {n.entry.p.x, max.y});
+    sum_depth += validate(n.children[1], depth + 1, {n.entry.p.x, min.y}, max);
   } else {
-    sum_depth += validate(node->children[0].get(), depth + 1, min, {max.x, node->entry.p.y});
-    sum_depth += validate(node->children[1].get(), depth + 1, {min.x, node->entry.p.y}, max);
+    sum_depth += validate(n.children[0], depth + 1, min, {max.x, n.entry.p.y});
+    sum_depth += validate(n.children[1], depth + 1, {min.x, n.entry.p.y}, max);
   }
   return sum_depth;
 }
@@ -216,6 +220,59 @@ TEMPLATE_TEST_CASE("KDTree", "[kdtree]",
     REQUIRE(tree.empty());
   }
 
+  SECTION("reserve keeps capacity across rebalances") {
+    TreeType reserved;
+    reserved.reserve(1000);
+    size_t capacity = reserved.capacity();
+    REQUIRE(capacity >= 1000);
+    for (size_t i = 0; i < points.size(); i++) {
+      reserved.insert(points[i], i);
+    }
+    reserved.rebalance();
+    reserved.validate();
+    REQUIRE(reserved.size() == points.size());
+    REQUIRE(reserved.capacity() == capacity);
+
+    // Without a reservation, a rebuild shrinks storage to fit what's left.
+    for (size_t i = 1; i < points.size(); i++) {
+      REQUIRE(tree.remove(points[i]));
+    }
+    tree.rebalance();
+    REQUIRE(tree.capacity() == 1);
+    for (size_t i = 1; i < points.size(); i++) {
+      REQUIRE(reserved.remove(points[i]));
+    }
+    reserved.rebalance();
+    REQUIRE(reserved.capacity() == capacity);
+
+    // Likewise clear releases the storage, down to the reservation.
+    tree.clear();
+    REQUIRE(tree.capacity() == 0);
+    reserved.clear();
+    REQUIRE(reserved.capacity() == capacity);
+  }
+
+  SECTION("Iteration skips removed entries") {
+    std::vector<PointType> kept;
+    for (size_t i = 0; i < points.size(); i++) {
+      if (i % 3 == 0) {
+        REQUIRE(tree.remove(points[i]));
+      } else {
+        kept.push_back(points[i]);
+      }
+    }
+    tree.insert(PointType(-5, -5), 1);  // Reuses a freed slot.
+    kept.push_back(PointType(-5, -5));
+
+    std::vector<PointType> iterated;
+    for (const auto& e : tree) {
+      iterated.push_back(e.p);
+    }
+    c_sort(kept);
+    c_sort(iterated);
+    REQUIRE(iterated == kept);
+  }
+
   SECTION("pop works") {
     REQUIRE(tree.size() == points.size());
     while (!tree.empty()) {
@@ -234,6 +291,41 @@ TEMPLATE_TEST_CASE("KDTree", "[kdtree]",
     }
   }
 
+  SECTION("insert_many works") {
+    std::vector<Entry> batch(entries.begin(), entries.end());
+    std::mt19937 gen(42);
+    for (int i = 0; i < 100; ++i) {
+      batch.push_back({gen_point_in_range<PointType>(gen, -20, 20), ValueType(1000 + i)});
+    }
+    std::shuffle(batch.begin(), batch.end(), gen);
+
+    std::vector<PointType> expected(points);
+    for (const Entry& e : batch) {
+      if (!c_linear_search(expected, e.p)) {
+        expected.push_back(e.p);
+      }
+    }
+
+    size_t before = tree.size();
+    REQUIRE(tree.insert_many(batch) == expected.size() - before);
+    REQUIRE(tree.size() == expected.size());
+    tree.validate();
+    for (const Entry& e : entries) {
+      REQUIRE(tree.find(e.p)->value == e.value);
+    }
+
+    // A batch that is small relative to the tree is inserted entry by entry.
+    REQUIRE(tree.insert_many({entries[0], {PointType(50, 50), ValueType(7)}}) == 1);
+    REQUIRE(tree.find(PointType(50, 50))->value == ValueType(7));
+    tree.validate();
+
+    // Duplicates within the batch keep the first value.
+    TreeType dup_tree({{{1, 1}, 1}, {{2, 2}, 2}, {{1, 1}, 3}});
+    REQUIRE(dup_tree.size() == 2);
+    REQUIRE(dup_tree.find(PointType(1, 1))->value == 1);
+    dup_tree.validate();
+  }
+
   SECTION("find_closest with max_dist works") {
     TreeType tree({
         {{0, 0}, 1},
@@ -261,6 +353,30 @@ TEMPLATE_TEST_CASE("KDTree", "[kdtree]",
     REQUIRE(!tree.find_closest(PointType{2, 2}, Linf{}, 1).has_value());
   }
 
+  SECTION("find_closest with max_dist includes matches on a far split") {
+    // (10, 0) is across the root's split, exactly max_dist from the query.
+    TreeType tree;
+    tree.insert(PointType{10, 100}, 1);
+    tree.insert(PointType{0, 0}, 2);
+    tree.insert(PointType{10, 0}, 3);
+    REQUIRE(tree.find_closest(PointType{6, 0}, L1{}, 4)->value == 3);
+    REQUIRE(tree.find_closest(PointType{6, 0}, L2{}, 4)->value == 3);
+    REQUIRE(tree.find_closest(PointType{6, 0}, L2sq{}, 16)->value == 3);
+    REQUIRE(tree.find_closest(PointType{6, 0}, Linf{}, 4)->value == 3);
+  }
+
+  SECTION("L2 on large coordinates doesn't overflow") {
+    // L2 searches compare squared distances, which must not overflow for integer
+    // coords: 65536^2 wraps to 0 in 32 bits.
+    TreeType tree({
+        {{65536, 0}, 1},
+        {{10, 10}, 2},
+    });
+    REQUIRE(tree.find_closest(PointType{0, 0}, L2{}).value == 2);
+    REQUIRE(tree.find_closest_k(PointType{0, 0}, 1, L2{})[0].value == 2);
+    REQUIRE(tree.find_all_within(PointType{0, 0}, L2{}, 20).size() == 1);
+  }
+
   SECTION("find_closest_k works") {
     TreeType tree({
         {{0, 0}, 1},
@@ -327,6 +443,88 @@ TEMPLATE_TEST_CASE("KDTree", "[kdtree]",
     test_metric(Linf{}, "Linf", radius);
   }
 
+  SECTION("exists_within matches brute force") {
+    TreeType tree;
+    std::vector<PointType> pts;
+    std::mt19937 gen(42);
+    for (int i = 0; i < 1000; ++i) {
+      PointType p = gen_point_in_range<PointType>(gen, -100, 100);
+      if (tree.insert(p, i)) {
+        pts.push_back(p);
+      }
+    }
+
+    auto test_metric = [&](auto metric, const std::string& label, double r) {
+      INFO("Testing metric: " << label);
+      for (int i = 0; i < 100; ++i) {
+        PointType query = gen_point_in_range<PointType>(gen, -120, 120);
+        bool expected = false;
+        for (const auto& p : pts) {
+          expected = expected || metric.dist(p, query) <= r;
+        }
+        INFO("Query: " << query);
+        REQUIRE(tree.exists_within(query, metric, r) == expected);
+      }
+    };
+
+    test_metric(L1{}, "L1", 5);
+    test_metric(L2sq{}, "L2sq", 9);
+    test_metric(L2{}, "L2", 3);
+    test_metric(Linf{}, "Linf", 2);
+    REQUIRE(tree.exists_within(pts[0], L2{}, 0));
+    REQUIRE_FALSE(TreeType().exists_within(PointType{0, 0}, L2{}, 10));
+  }
+
+  SECTION("find_closest matches brute force") {
+    TreeType tree;
+    std::vector<PointType> pts;
+    std::mt19937 gen(42);
+    for (int i = 0; i < 1000; ++i) {
+      PointType p = gen_point_in_range<PointType>(gen, -100, 100);
+      if (tree.insert(p, i)) {
+        pts.push_back(p);
+      }
+    }
+
+    auto test_metric = [&](auto metric, const std::string& label) {
+      INFO("Testing metric: " << label);
+      for (int i = 0; i < 100; ++i) {
+        PointType query = gen_point_in_range<PointType>(gen, -120, 120);
+        auto best = metric.dist(pts[0], query);
+        for (const auto& p : pts) {
+          best = std::min(best, metric.dist(p, query));
+        }
+        INFO("Query: " << query);
+        REQUIRE(metric.dist(tree.find_closest(query, metric).p, query) == best);
+      }
+    };
+
+    test_metric(L1{}, "L1");
+    test_metric(L2sq{}, "L2sq");
+    test_metric(L2{}, "L2");
+    test_metric(Linf{}, "Linf");
+  }
+
+  SECTION("pop_closest removes the closest entry") {
+    TreeType tree;
+    std::mt19937 gen(42);
+    for (int i = 0; i < 500; ++i) {
+      tree.insert(gen_point_in_range<PointType>(gen, -100, 100), i);
+    }
+
+    PointType query(7, -3);
+    while (!tree.empty()) {
+      auto expected = tree.find_closest(query, L2{});
+      size_t size = tree.size();
+      auto popped = tree.pop_closest(query, L2{});
+      REQUIRE(L2{}.dist(popped.p, query) == L2{}.dist(expected.p, query));
+      REQUIRE(!tree.exists(popped.p));
+      REQUIRE(tree.size() == size - 1);
+      tree.validate();
+    }
+    REQUIRE(!tree.pop_closest(query, L2{}, 10).has_value());
+  }
+
   SECTION("Structured bindings") {
     for (auto [p, v] : tree) {
       REQUIRE(tree.find(p)->value == v);
@@ -62,6 +62,25 @@ def test_find_closest():
     closest = tree.find_closest(p)
     assert closest.value == 1
 
+def test_point_like_inputs():
+    """Test the accepted point-like argument forms."""
+    import numpy as np
+    tree = kdtree.KDTreed()
+    assert tree.insert((1.0, 2.0), 1)
+    assert tree.insert([3, 4], 2)
+    assert tree.insert(kdtree.Pointd(5.0, 6.0), 3)
+    assert tree.insert(np.array([7.0, 8.0]), 4)
+
+    assert tree.find([1.0, 2.0]).value == 1
+    assert tree.find((3.0, 4.0)).value == 2
+    assert tree.find(kdtree.Pointi(5, 6)).value == 3
+    assert tree.find_closest(np.array([7.1, 8.1])).value == 4
+
+    with pytest.raises(RuntimeError, match="exactly 2 coordinates"):
+        tree.insert((1.0, 2.0, 3.0), 5)
+    with pytest.raises(RuntimeError, match="exactly 2 coordinates"):
+        tree.find_closest([1.0])
+
 def test_find_closest_with_max_dist():
     """Test nearest neighbor with distance limit."""
     tree = kdtree.KDTreed()
@@ -109,6 +128,148 @@ def test_find_closest_k():
     res = tree.find_closest_k((0.5, 0.5), 10, kdtree.L2sq(), 0.1)
     assert len(res) == 0
 
+def test_find_closest_batch():
+    """Test batched nearest neighbor queries."""
+    import numpy as np
+    rng = np.random.default_rng(42)
+    coords = rng.uniform(-100, 100, size=(1000, 2))
+    tree = kdtree.KDTreed(coords, np.arange(1000))
+
+    queries = rng.uniform(-120, 120, size=(200, 2))
+    for metric in [None, kdtree.L1(), kdtree.L2(), kdtree.Linf()]:
+        result = tree.find_closest_batch(queries, metric)
+        assert result.dtype == np.int64
+        expected = [tree.find_closest(tuple(q), metric).value for q in queries]
+        assert result.tolist() == expected
+
+    assert len(tree.find_closest_batch(np.zeros((0, 2)))) == 0
+    with pytest.raises(RuntimeError, match="Nx2"):
+        tree.find_closest_batch(np.zeros(4))
+    with pytest.raises(ValueError, match="non-empty"):
+        kdtree.KDTreei().find_closest_batch([[0, 0]])
+    assert not hasattr(kdtree.KDTreePyd(), "find_closest_batch")
+
+    # Queries with no closest entry raise rather than return garbage.
+    with pytest.raises(ValueError, match="no entry"):
+        tree.find_closest_batch([[float("nan"), 0], [0.2, 0.1]])
+    assert tree.find_closest((float("nan"), 0)) is None
+
+def test_find_closest_batch_threaded():
+    """Test the tree can't be modified while a batch reads it without the GIL."""
+    import threading
+    import time
+    import numpy as np
+    rng = np.random.default_rng(42)
+    coords = rng.uniform(0, 1, size=(10000, 2))
+    tree = kdtree.KDTreed(coords, np.arange(10000))
+    queries = rng.uniform(0, 1, size=(100000, 2))
+    expected = tree.find_closest_batch(queries)
+    done = threading.Event()
+    results = []
+
+    def reader():
+        while not done.is_set():
+            results.append(tree.find_closest_batch(queries))
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    refused = 0
+    try:
+        for i in range(2000):
+            # Points outside the unit square never change the closest entries.
+            try:
+                tree.insert((2.0 + i, 2.0), -1)
+                tree.remove((2.0 + i // 2, 2.0))
+                if i % 100 == 0:
+                    tree.rebalance()
+            except RuntimeError as e:
+                assert "find_closest_batch" in str(e)
+                refused += 1
+    finally:
+        done.set()
+        thread.join()
+    assert refused > 0
+    assert all(r.tolist() == expected.tolist() for r in results)
+
+    # Converting a point can run Python code, which can start a batch in between.
+    big = rng.uniform(0, 1, size=(1000000, 2))
+    threads = []
+
+    class StartsBatch:
+        def __float__(self):
+            thread = threading.Thread(target=tree.find_closest_batch, args=(big,))
+            threads.append(thread)
+            thread.start()
+            time.sleep(0.005)
+            return 0.5
+
+    try:
+        with pytest.raises(RuntimeError, match="find_closest_batch"):
+            tree.insert((StartsBatch(), 0.5), -1)
+        with pytest.raises(RuntimeError, match="find_closest_batch"):
+            tree.remove((StartsBatch(), 0.5))
+        with pytest.raises(RuntimeError, match="find_closest_batch"):
+            tree.pop_closest((StartsBatch(), 0.5))
+    finally:
+        for thread in threads:
+            thread.join()
+
+def test_float_tree():
+    """Test the float coordinate tree accepts double inputs."""
+    import numpy as np
+    tree = kdtree.KDTreef()
+    assert tree.insert((1.5, 2.5), 1)
+    assert tree.insert(kdtree.Pointd(3.0, 4.0), 2)
+    assert tree.insert(np.array([5.0, 6.0]), 3)
+    assert not tree.insert(kdtree.Pointf(1.5, 2.5), 4)
+
+    result = tree.find((1.5, 2.5))
+    assert isinstance(result.p, kdtree.Pointf)
+    assert result.value == 1
+    assert tree.find_closest((3.1, 3.9), kdtree.L2()).value == 2
+    assert tree.find_closest_batch([[0.0, 0.0], [5.2, 6.1]]).tolist() == [1, 3]
+
+    # Coordinates are rounded to float precision.
+    assert tree.insert((0.1, 0.0), 5)
+    assert tree.exists((0.1 + 1e-10, 0.0))
+
+def test_numba_fallback():
+    """Test the Numba fallback agrees with the extension."""
+    import numpy as np
+    import kdtree_numba
+    rng = np.random.default_rng(7)
+    coords = rng.integers(-50, 50, size=(500, 2))
+    tree = kdtree.KDTreei(coords, np.arange(500))
+    fallback = kdtree_numba.KDTreei(coords, np.arange(500))
+    assert len(fallback) == len(tree)
+    assert fallback.find(tuple(coords[3])).value == tree.find(tuple(coords[3])).value
+
+    queries = rng.integers(-60, 60, size=(50, 2))
+    for metric in ["L1", "L2", "L2sq", "Linf"]:
+        m, fm = getattr(kdtree, metric)(), getattr(kdtree_numba, metric)()
+        for q in map(tuple, queries):
+            expected = tree.find_closest(q, m)
+            result = fallback.find_closest(q, fm)
+            assert fm.dist(result.p, q) == m.dist(expected.p, q)
+        closest = fallback.find_closest_batch(queries, fm)
+        assert [fm.dist(coords[v], q) for v, q in zip(closest, queries)] == \
+            [m.dist(tree.find_closest(tuple(q), m).p, q) for q in queries]
+
+    with pytest.raises(ValueError, match="Metric must be specified"):
+        fallback.find_closest((0, 0), max_dist=1)
+    assert fallback.find_closest((1000, 1000), kdtree_numba.L1(), 10) is None
+    with pytest.raises(ValueError, match="no entry"):
+        kdtree_numba.KDTreed(coords, np.arange(500)).find_closest_batch([[np.nan, 0], [1, 1]])
+
+    l2sq = kdtree.L2sq()
+    while fallback:
+        popped = fallback.pop_closest((3, 4))
+        expected = tree.pop_closest((3, 4))
+        assert l2sq.dist(popped.p, (3, 4)) == l2sq.dist(expected.p, (3, 4))
+        assert not fallback.exists(popped.p)
+    assert tree.empty()
+    assert fallback.pop_closest((3, 4)) is None
+
 def test_norm_parameter():
     """Test L1 vs L2 distance."""
     tree = kdtree.KDTreed()
@@ -176,6 +337,18 @@ def test_rebalance():
     tree.rebalance()
     assert len(tree) == 100
 
+def test_reserve():
+    """Test inserting after reserving room."""
+    for tree_type in [kdtree.KDTreei, kdtree.KDTreePyd]:
+        tree = tree_type()
+        tree.reserve(100)
+        assert tree.empty()
+        for i in range(100):
+            assert tree.insert((i, i * 2), i)
+        tree.rebalance()
+        assert len(tree) == 100
+        assert tree.find_closest((50, 99)).value == 50
+
 def test_iterator():
     """Test iteration."""
     tree = kdtree.KDTreei()
@@ -202,6 +375,64 @@ def test_buffer_interface():
     assert len(tree) == 3
     assert tree.find((1.0, 1.0)).value == 20
 
+def test_buffer_duplicates_and_casting():
+    """Test buffer construction drops duplicates and converts coordinate dtypes."""
+    import numpy as np
+    coords = np.array([[0, 0], [1, 1], [0, 0]], dtype=np.int32)
+    values = [10, 20, 30]
+
+    tree = kdtree.KDTreed(coords, values)
+    assert len(tree) == 2
+    assert tree.find((0.0, 0.0)).value == 10
+
+    with pytest.raises(RuntimeError, match="Nx2"):
+        kdtree.KDTreed(np.zeros((3, 3)), [1, 2, 3])
+    with pytest.raises(RuntimeError, match="length"):
+        kdtree.KDTreed(coords, [1, 2])
+
+def test_insert_many():
+    """Test bulk insertion into an existing tree."""
+    import numpy as np
+    tree = kdtree.KDTreei()
+    tree.insert((1, 2), 5)
+
+    coords = np.array([[i, i * 2] for i in range(100)])
+    assert tree.insert_many(coords, np.arange(100)) == 99
+    assert len(tree) == 100
+    assert tree.find((1, 2)).value == 5  # Existing value is kept, like insert
+    assert tree.find((50, 100)).value == 50
+
+    pytree = kdtree.KDTreePyd()
+    assert pytree.insert_many([[0.0, 0.0], [1.0, 1.0]], ["a", "b"]) == 2
+    assert pytree.find_closest((0.9, 0.9)).value == "b"
+
+def test_insert_many_threaded():
+    """Test queries from another thread never see insert_many mid-rebuild."""
+    import threading
+    import numpy as np
+    rng = np.random.default_rng(42)
+    tree = kdtree.KDTreed()
+    tree.insert((0.5, 0.5), -1)
+    done = threading.Event()
+    misses = []
+
+    def reader():
+        while not done.is_set():
+            if tree.find_closest((0.5, 0.5)) is None:
+                misses.append(1)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    try:
+        for _ in range(10):
+            tree.insert_many(rng.uniform(0, 1, size=(10000, 2)), np.arange(10000))
+            tree.pop_closest((0.5, 0.5))
+            tree.insert((0.5, 0.5), -1)
+    finally:
+        done.set()
+        thread.join()
+    assert not misses
+
 def test_python_objects():
     """Test storing arbitrary Python objects."""
     tree = kdtree.KDTreePyd()
@@ -211,6 +442,30 @@ def test_python_objects():
     assert tree.find((1.0, 2.0)).value["name"] == "Alice"
     assert tree.find((3.0, 4.0)).value[0] == "Bob"
 
+def test_python_object_lifetime():
+    """Test Python object trees hold exactly one reference per stored value."""
+    import sys
+    tree = kdtree.KDTreePyi()
+    obj = object()
+    base = sys.getrefcount(obj)
+
+    assert tree.insert((0, 0), obj)
+    assert not tree.insert((0, 0), obj)  # Duplicate is not kept
+    assert tree.insert_many([[1, 1], [1, 1], [0, 0]], [obj, obj, obj]) == 1
+    assert sys.getrefcount(obj) == base + 2
+
+    assert [e.value for e in tree] == [obj, obj]
+    for _ in range(100):
+        tree.insert((5, 5), obj)
+        assert tree.remove((5, 5))
+    tree.rebalance()
+    assert sys.getrefcount(obj) == base + 2
+
+    assert tree.remove((0, 0))
+    assert tree.pop_closest((0, 0)).value is obj
+    assert sys.getrefcount(obj) == base
+    assert tree.empty()
+
 def test_toroidal():
     """Test toroidal (wraparound) distance."""
     bounds = kdtree.Pointd(100, 100)
@@ -264,6 +519,43 @@ def test_find_all_within():
     expected_linf = [p for p, i in points if max(abs(p[0]), abs(p[1])) <= radius]
     assert len(found_linf) == len(expected_linf)
 
+def test_exists_within():
+    """Test checking for any point within a radius."""
+    tree = kdtree.KDTreePyd()
+    tree.insert((0, 0), "a")
+    tree.insert((10, 0), "b")
+
+    assert tree.exists_within((3, 4), kdtree.L2(), 5.0)  # Inclusive
+    assert not tree.exists_within((3, 4), kdtree.L2(), 4.9)
+    assert tree.exists_within((5, 0), kdtree.L1(), 5.0)
+    assert not tree.exists_within((5, 5), kdtree.Linf(), 4.9)
+
+    with pytest.raises(TypeError):
+        tree.exists_within((0, 0), radius=10.0)
+
+def test_metric_subclasses():
+    """Test Python subclasses of metrics dispatch like their base metric."""
+    class MyL1(kdtree.L1):
+        pass
+
+    class MyToroidalL1(kdtree.ToroidalL1):
+        pass
+
+    tree = kdtree.KDTreed()
+    tree.insert((10, 0), 1)
+    tree.insert((9, 4), 2)
+    tree.insert((7, 7), 3)
+    assert tree.find_closest((0, 0), MyL1()).value == 1
+    assert tree.exists_within((0, 0), MyL1(), 10.0)
+
+    # (2, 5) is closest to (1, 1) in plain L1, (10, 0) once wrapping around at 12.
+    tree.insert((2, 5), 4)
+    assert tree.find_closest((1, 1), MyL1()).value == 4
+    assert tree.find_closest((1, 1), MyToroidalL1(kdtree.Pointd(12, 12))).value == 1
+
+    with pytest.raises(TypeError, match="Unsupported metric"):
+        tree.find_closest((0, 0), object())
+
 def test_metric_enforcement():
     """Test that metric is required when max_dist or radius is provided."""
     tree = kdtree.KDTreed()
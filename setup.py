@@ -1,14 +1,32 @@
+import os
+import sys
+
 from setuptools import setup, Extension
 from pybind11.setup_helpers import Pybind11Extension, build_ext
 import pybind11
 
+# OpenMP parallelises find_closest_batch. Only enabled where the default toolchain
+# ships it; elsewhere the batch queries run serially.
+openmp = ["-fopenmp"] if sys.platform.startswith("linux") else []
+
+# Builds are portable by default. Set KDTREE_MARCH (e.g. "native", "x86-64-v3") to
+# target a specific instruction set, for a local build or a per-ISA wheel.
+march = [f"-march={os.environ['KDTREE_MARCH']}"] if os.environ.get("KDTREE_MARCH") else []
+
+# A failed build is an error unless KDTREE_OPTIONAL_EXT is set, in which case the install
+# succeeds without the extension, leaving the kdtree_numba fallback. Opt-in so that
+# normal and dev builds never hide a compile error behind a stale extension.
+optional = os.environ.get("KDTREE_OPTIONAL_EXT", "") not in ("", "0")
+
 ext_modules = [
     Pybind11Extension(
         "kdtree",
         ["kdtree_bindings.cpp"],
         include_dirs=[pybind11.get_include()],
         cxx_std=20,
-        extra_compile_args=["-O3", "-Wall", "-Wextra"],
+        extra_compile_args=["-O3", "-Wall", "-Wextra"] + openmp + march,
+        extra_link_args=openmp,
+        optional=optional,
     ),
 ]
 
@@ -21,6 +39,6 @@ setup(
     cmdclass={"build_ext": build_ext},
     zip_safe=False,
     python_requires=">=3.8",
-    install_requires=["pybind11>=2.10.0"],
+    install_requires=["pybind11>=2.10.0", "numpy"],
     license_files = ('LICENSE',),
 )